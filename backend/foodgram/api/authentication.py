@@ -0,0 +1,44 @@
+"""Token authentication backed by the `auth` cache.
+
+Only the id of the token's user is stored, so an authenticated request
+loads the user by primary key instead of joining the token table. The
+user itself is never cached: counters, password and `is_active` are
+always current, and a later save of `request.user` does not write back
+stale values. Entries expire after `AUTH_TOKEN_CACHE_TTL` seconds and
+are dropped by the signals in `api.signals` on logout and token
+deletion. With the default process-local cache other processes see
+a deleted token after the TTL at most.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def token_cache_key(key):
+    return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def invalidate_tokens(*keys):
+    caches['auth'].delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cache = caches['auth']
+        cache_key = token_cache_key(key)
+        user_id = cache.get(cache_key)
+        user = None
+        if user_id is not None:
+            user = get_user_model().objects.filter(pk=user_id).first()
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, user.pk)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,76 @@
+"""Validators for conditional GET of read endpoints.
+
+Used with `django.views.decorators.http.condition`, so a request
+carrying a matching `If-None-Match` or `If-Modified-Since` gets 304
+before anything is serialized. Lookups are cached on the request because
+`condition` calls the ETag and Last-Modified functions separately.
+"""
+from recipes.models import Ingredient, Recipe, TableVersion, Tag
+
+
+def _cached(request, key, load):
+    request = getattr(request, '_request', request)
+    cache = request.__dict__.setdefault('_conditional_state', {})
+    if key not in cache:
+        cache[key] = load()
+    return cache[key]
+
+
+def table_version(request, model):
+    versions = _cached(request, 'tables', TableVersion.objects.get_all)
+    label = model._meta.label_lower
+    return versions.get(label) or TableVersion(
+        table=label, version=0, updated=None)
+
+
+def _media_type(request):
+    return getattr(request, 'accepted_media_type', '')
+
+
+def _table_etag(model):
+    def etag(request, *args, **kwargs):
+        version = table_version(request, model).version
+        return (f'{model._meta.model_name}-{version}-'
+                f'{_media_type(request)}')
+    return etag
+
+
+def _table_last_modified(model):
+    def last_modified(request, *args, **kwargs):
+        return table_version(request, model).updated
+    return last_modified
+
+
+tag_etag = _table_etag(Tag)
+tag_last_modified = _table_last_modified(Tag)
+ingredient_etag = _table_etag(Ingredient)
+ingredient_last_modified = _table_last_modified(Ingredient)
+
+
+def _recipe_state(request, pk):
+    try:
+        pk = int(pk)
+    except ValueError:
+        return None
+    return _cached(request, ('recipe', pk), lambda: Recipe.objects.filter(
+        pk=pk).with_user_flags(request.user).values(
+            'updated', 'is_favorited', 'is_in_shopping_cart',
+            'author_is_subscribed').first())
+
+
+def recipe_etag(request, pk, *args, **kwargs):
+    """Recipe change time, viewer flags and versions of embedded tags
+    and ingredients.
+
+    There is no Last-Modified for recipes: favorites, carts and
+    subscriptions of the viewer change the payload without a timestamp.
+    """
+    state = _recipe_state(request, pk)
+    if state is None:
+        return None
+    flags = ''.join(str(int(state[flag])) for flag in (
+        'is_favorited', 'is_in_shopping_cart', 'author_is_subscribed'))
+    return (f'recipe-{pk}-{state["updated"].timestamp()}-{flags}-'
+            f'{table_version(request, Tag).version}-'
+            f'{table_version(request, Ingredient).version}-'
+            f'{_media_type(request)}')
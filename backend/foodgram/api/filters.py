@@ -6,25 +6,41 @@ from recipes.models import Recipe, Tag
 class RecipeFilter(django_filters.FilterSet):
     """Custom filter for Recipes."""
     tags = django_filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
+        field_name='tags__slug',
         queryset=Tag.objects.all(),
-        to_field_name="slug",)
+        to_field_name='slug',
+        method='get_tags')
     is_favorited = django_filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='get_is_in_shopping_cart')
+    search = django_filters.CharFilter(method='get_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='get_ordering')
 
     class Meta:
         model = Recipe
         fields = {'author', }
 
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.with_any_tag(value)
+
     def get_is_favorited(self, queryset, name, value):
-        user = self.request.user
         if value == 1:
-            return queryset.filter(favorite__user=user)
-        return Recipe.objects.all()
+            return queryset.favorited_by(self.request.user)
+        return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
         if value == 1:
-            return queryset.filter(cart__user=user)
-        return Recipe.objects.all()
+            return queryset.in_cart_of(self.request.user)
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-created', '-id')
+        return queryset
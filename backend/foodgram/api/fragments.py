@@ -0,0 +1,71 @@
+"""Cache of the viewer-independent part of serialized recipes.
+
+A fragment is the JSON of a recipe without `is_favorited`,
+`is_in_shopping_cart` and `author.is_subscribed`. Its key contains
+`Recipe.updated`, which is refreshed when the recipe, its tags or
+ingredients or its author change, and the tag and ingredient table
+versions, so stale fragments are never read and fall out of the LRU.
+"""
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from api.conditional import table_version
+from recipes.models import Ingredient, Tag
+
+VIEWER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
+
+class RecipeFragments:
+    """Fragments loaded for the current request."""
+
+    def __init__(self, request):
+        self.request = request
+        self.cache = caches['fragments']
+        self.loaded = {}
+        # Image URLs are absolute, so fragments depend on the host.
+        host = hashlib.md5(
+            request.build_absolute_uri('/').encode()).hexdigest()[:8]
+        self.prefix = (f'recipe-fragment:{host}:'
+                       f'{table_version(request, Tag).version}:'
+                       f'{table_version(request, Ingredient).version}')
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the fragments cached on the request, creating them
+        once."""
+        request = getattr(request, '_request', request)
+        fragments = getattr(request, '_recipe_fragments', None)
+        if fragments is None:
+            fragments = cls(request)
+            request._recipe_fragments = fragments
+        return fragments
+
+    def key(self, recipe):
+        return f'{self.prefix}:{recipe.pk}:{recipe.updated.timestamp()}'
+
+    def prime(self, recipes):
+        """Load fragments of `recipes` with one cache lookup."""
+        keys = [key for key in map(self.key, recipes)
+                if key not in self.loaded]
+        if keys:
+            found = self.cache.get_many(keys)
+            self.loaded.update((key, found.get(key)) for key in keys)
+
+    def get(self, recipe):
+        """Return the cached fragment of `recipe` as a dict, or None."""
+        key = self.key(recipe)
+        if key not in self.loaded:
+            self.loaded[key] = self.cache.get(key)
+        content = self.loaded[key]
+        return None if content is None else json.loads(content)
+
+    def set(self, recipe, data):
+        """Cache `data`, a full representation of `recipe`, with its
+        viewer-dependent fields blanked."""
+        fragment = dict(data, **dict.fromkeys(VIEWER_FIELDS))
+        fragment['author'] = dict(data['author'], is_subscribed=None)
+        content = json.dumps(fragment, ensure_ascii=False)
+        self.cache.set(self.key(recipe), content)
+        self.loaded[self.key(recipe)] = content
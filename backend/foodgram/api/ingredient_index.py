@@ -0,0 +1,72 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+
+class IngredientPrefixIndex:
+    """Process-local sorted index of ingredient names for autocomplete.
+
+    Built from the whole `Ingredient` table on first use, dropped by the
+    `Ingredient` signals of this process and rebuilt at least every
+    `INGREDIENTS_INDEX_TTL` seconds so changes made by other processes
+    show up as well.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._rows = None
+        self._built_at = 0
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._keys = None
+        self._rows = None
+
+    def is_warm(self):
+        ttl = getattr(settings, 'INGREDIENTS_INDEX_TTL', 300)
+        return (self._keys is not None
+                and time.monotonic() - self._built_at < ttl)
+
+    def build(self):
+        generation = self._generation
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id']))
+        keys = [row['name'].casefold() for row in rows]
+        if generation != self._generation:
+            return
+        self._keys, self._rows = keys, rows
+        self._built_at = time.monotonic()
+
+    def search(self, prefix, limit):
+        """Return up to `limit` ingredients whose name starts with
+        `prefix`, or None if the index is cold and another thread is
+        building it."""
+        if not self.is_warm():
+            if not self._lock.acquire(blocking=False):
+                return None
+            try:
+                if not self.is_warm():
+                    self.build()
+            finally:
+                self._lock.release()
+        keys, rows = self._keys, self._rows
+        if keys is None:
+            return None
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(keys, prefix)
+        result = []
+        for index in range(start, len(keys)):
+            if len(result) >= limit or not keys[index].startswith(prefix):
+                break
+            result.append(rows[index])
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,185 @@
+"""Timing of API requests.
+
+`MetricsMiddleware` measures a sample of `/api/` requests, controlled by
+`METRICS_SAMPLE_RATE`. It records the number and time of SQL queries,
+serializer and renderer time and the total time. The numbers are sent
+back in the `Server-Timing` header and added to per-route histograms of
+this process, which `render_prometheus` exports in the Prometheus text
+format. Every worker process keeps its own histograms, so a scrape of
+`/api/metrics/` returns those of whichever worker answered it.
+"""
+import contextlib
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+METRICS = (
+    ('request_duration_seconds', 'total', DURATION_BUCKETS,
+     'Total time of the request.'),
+    ('db_duration_seconds', 'db', DURATION_BUCKETS,
+     'Time spent in SQL queries.'),
+    ('db_queries', 'queries', QUERY_BUCKETS,
+     'Number of SQL queries.'),
+    ('serialize_duration_seconds', 'serialize', DURATION_BUCKETS,
+     'Time spent in views outside SQL queries, mostly in serializers.'),
+    ('render_duration_seconds', 'render', DURATION_BUCKETS,
+     'Time spent rendering the response.'),
+)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {
+    name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+    for name, _, buckets, _ in METRICS
+}
+
+
+def observe(labels, values):
+    with _lock:
+        for name, key, _, _ in METRICS:
+            if key in values:
+                _histograms[name][labels].observe(values[key])
+
+
+def _format_labels(labels, **extra):
+    pairs = dict(zip(('method', 'route', 'status'), labels), **extra)
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in pairs.items())
+
+
+def render_prometheus():
+    """Histograms of this process in the Prometheus text format."""
+    lines = []
+    with _lock:
+        for metric, _, _, description in METRICS:
+            name = f'foodgram_{metric}'
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in sorted(_histograms[metric].items()):
+                bounds = histogram.buckets + ('+Inf',)
+                counts = histogram.counts + [histogram.count]
+                for bound, count in zip(bounds, counts):
+                    lines.append(f'{name}_bucket'
+                                 f'{{{_format_labels(labels, le=bound)}}}'
+                                 f' {count}')
+                lines.append(
+                    f'{name}_sum{{{_format_labels(labels)}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{_format_labels(labels)}}}'
+                             f' {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Timings of one sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = defaultdict(float)
+        self._view_started = None
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the metrics of a sampled request, or None."""
+        request = getattr(request, '_request', request)
+        return getattr(request, '_metrics', None)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.durations['db'] += time.perf_counter() - started
+
+    def view_started(self):
+        self._view_started = (time.perf_counter(), self.durations['db'])
+
+    def view_finished(self):
+        """Add the time since `view_started` less its SQL time to
+        `serialize`."""
+        if self._view_started is None:
+            return
+        started, db = self._view_started
+        self._view_started = None
+        self.durations['serialize'] += (
+            time.perf_counter() - started - (self.durations['db'] - db))
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (not request.path.startswith('/api/')
+                or random.random() >= settings.METRICS_SAMPLE_RATE):
+            return self.get_response(request)
+        metrics = request._metrics = RequestMetrics()
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute_wrapper))
+            response = self.get_response(request)
+        # Responses rendered by the view itself skip
+        # `process_template_response`.
+        metrics.view_finished()
+        total = time.perf_counter() - started
+        durations = metrics.durations
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={durations["db"] * 1000:.1f};'
+             f'desc="{metrics.queries} queries"']
+            + [f'{name};dur={durations[name] * 1000:.1f}'
+               for name in ('serialize', 'render')]
+            + [f'total;dur={total * 1000:.1f}'])
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        observe((request.method, route, response.status_code),
+                dict(durations, queries=metrics.queries, total=total))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Views read serializer data before the response exists, so the
+        # view is timed as a whole and its SQL time taken away.
+        metrics = RequestMetrics.for_request(request)
+        if metrics is not None:
+            metrics.view_started()
+
+    def process_template_response(self, request, response):
+        metrics = RequestMetrics.for_request(request)
+        if metrics is None:
+            return response
+        metrics.view_finished()
+        started = time.perf_counter()
+
+        def rendered(response):
+            metrics.durations['render'] += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
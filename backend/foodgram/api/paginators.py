@@ -1,9 +1,203 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
 from django.core import paginator
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LookaheadPage(paginator.Page):
+    """Page that knows whether a next one exists from the rows fetched
+    with it."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class CachedCountPaginator(paginator.Paginator):
+    """Paginator that keeps `count` of a query in the cache for
+    `PAGINATION_COUNT_CACHE_TIMEOUT` seconds.
+
+    The cached count may be stale, so pages do not depend on it: a page
+    fetches one extra row to find out whether the next page exists.
+    """
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise paginator.PageNotAnInteger('Номер страницы не число.')
+        if number < 1:
+            raise paginator.EmptyPage('Номер страницы меньше 1.')
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise paginator.EmptyPage('На этой странице нет результатов.')
+        return LookaheadPage(rows[:self.per_page], number, self,
+                             len(rows) > self.per_page)
+
+    @cached_property
+    def count(self):
+        timeout = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60)
+        query = getattr(self.object_list, 'query', None)
+        if not timeout or query is None:
+            return super().count
+        try:
+            sql = str(query)
+        except EmptyResultSet:
+            return 0
+        key = 'paginator-count:' + hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
+
+
+class KeysetPagination:
+    """Cursor pagination over a unique ordering, e.g. ('-created', '-id').
+
+    The cursor holds the ordering values of the last item of a page, so
+    the next page is a plain index range scan without COUNT or OFFSET.
+    """
+
+    def __init__(self, ordering, page_size, cursor_query_param):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.cursor_query_param = cursor_query_param
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        position = self.get_position(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        page = list(queryset[:self.page_size + 1])
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_position = [
+                getattr(page[-1], name) for name, _ in self.fields]
+        return page
+
+    def get_position(self, request, model):
+        """Ordering values of `model` decoded from the cursor, None for
+        the first page."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        return self.decode(cursor, model) if cursor else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode(self.next_position))
+
+    @cached_property
+    def fields(self):
+        """Pairs of (field name, is descending) of the ordering."""
+        return [(name.lstrip('-'), name.startswith('-'))
+                for name in self.ordering]
+
+    def after(self, position):
+        """Condition selecting rows that follow `position`."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for prev_index, (prev_name, _) in enumerate(
+                    self.fields[:index]):
+                step &= Q(**{prev_name: position[prev_index]})
+            condition |= step
+        return condition
+
+    @staticmethod
+    def encode(position):
+        values = [value.isoformat() if hasattr(value, 'isoformat')
+                  else value for value in position]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()).decode()
+
+    def decode(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value)
+                    for (name, _), value in zip(self.fields, values)]
+        except Exception:
+            raise NotFound('Неверный курсор.')
 
 
 class CustomPaginator(PageNumberPagination):
-    """Custom pagination class with new query params names."""
-    django_paginator_class = paginator.Paginator
+    """Custom pagination class with new query params names.
+
+    Views with a `cursor_ordering` attribute also support keyset pages
+    when the `cursor` query param is passed (empty for the first page),
+    except with the `cursor_conflicts` params, which order the list
+    otherwise. Page counts are cached unless the list belongs to the
+    viewer: the view sets `personal_list` or one of its `personal_params`
+    is passed.
+    """
+    django_paginator_class = CachedCountPaginator
     page_query_param = 'page'
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_query_param in request.query_params:
+            conflicts = [
+                name for name in getattr(view, 'cursor_conflicts', ())
+                if request.query_params.get(name)]
+            if conflicts:
+                raise ValidationError({
+                    name: f'Нельзя использовать вместе с '
+                          f'{self.cursor_query_param}.'
+                    for name in conflicts})
+            self.keyset = KeysetPagination(
+                ordering, self.get_page_size(request),
+                self.cursor_query_param)
+            return self.keyset.paginate_queryset(queryset, request)
+        if self.is_personal(request, view):
+            # The viewer must see their own writes at once.
+            self.django_paginator_class = paginator.Paginator
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def is_personal(request, view):
+        if getattr(view, 'personal_list', False):
+            return True
+        return any(request.query_params.get(name)
+                   for name in getattr(view, 'personal_params', ()))
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,79 @@
+"""Cache of pre-rendered tag and ingredient responses.
+
+Responses are stored as rendered JSON bytes in the `reference` cache
+under a key containing the table version, so any save or delete of a
+tag or ingredient (admin included) makes older entries unreachable and
+the LRU drops them eventually.
+"""
+import functools
+import hashlib
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from api.conditional import table_version
+
+_lock = threading.Lock()
+_stats = Counter()
+
+
+def _count(event, label):
+    with _lock:
+        _stats[event] += 1
+        _stats[f'{label}:{event}'] += 1
+
+
+def get_stats():
+    """Hit and miss counters of this process, in total and per table."""
+    with _lock:
+        return dict(_stats)
+
+
+def _cache_key(request, label, version):
+    variant = hashlib.md5(
+        f'{request.path} {request.accepted_media_type}'.encode()
+    ).hexdigest()
+    return f'reference:{label}:{version}:{variant}'
+
+
+def cached_reference(model):
+    """Serve the decorated viewset action from the reference cache.
+
+    Only successful responses rendered as JSON to requests without query
+    params (but the format) are cached, so that filters such as ingredient
+    name prefixes typed one letter at a time do not evict the full lists.
+    """
+    label = model._meta.label_lower
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            params = set(request.query_params) - {
+                api_settings.URL_FORMAT_OVERRIDE}
+            renderer = request.accepted_renderer
+            if params or not isinstance(renderer, JSONRenderer):
+                return method(self, request, *args, **kwargs)
+            cache = caches['reference']
+            key = _cache_key(
+                request, label, table_version(request, model).version)
+            content = cache.get(key)
+            if content is not None:
+                _count('hits', label)
+                return HttpResponse(
+                    content, content_type=request.accepted_media_type)
+            _count('misses', label)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context())
+            cache.set(key, content)
+            return HttpResponse(
+                content, content_type=request.accepted_media_type)
+        return wrapper
+    return decorator
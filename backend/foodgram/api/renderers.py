@@ -0,0 +1,110 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ShoppingCartRendererMixin:
+    """Renderer that can also stream shopping list rows.
+
+    Rows are dicts with `ingredient__name`,
+    `ingredient__measurement_unit` and `total_amount` keys.
+    """
+    charset = 'utf-8'
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class ShoppingCartTxtRenderer(ShoppingCartRendererMixin,
+                              renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data or '').encode(self.charset)
+
+    def stream(self, rows):
+        yield 'Ваш список покупок:\n\n'.encode(self.charset)
+        separator = ''
+        for row in rows:
+            yield (f'{separator}{row["ingredient__name"]} '
+                   f'({row["ingredient__measurement_unit"]}): '
+                   f'{row["total_amount"]}').encode(self.charset)
+            separator = '\n'
+
+
+class _Line:
+    """File-like object returning what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartCSVRenderer(ShoppingCartTxtRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(_Line())
+        yield writer.writerow(
+            ['name', 'measurement_unit', 'amount']).encode(self.charset)
+        for row in rows:
+            yield writer.writerow([
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['total_amount'],
+            ]).encode(self.charset)
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRendererMixin,
+                               renderers.JSONRenderer):
+
+    def stream(self, rows):
+        yield b'['
+        separator = ''
+        for row in rows:
+            yield (separator + json.dumps({
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['total_amount'],
+            }, ensure_ascii=False)).encode(self.charset)
+            separator = ','
+        yield b']'
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSON renderer using `orjson` when it is installed.
+
+    Falls back to the standard renderer for indented output and for data
+    `orjson` can not encode.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(
+                accepted_media_type or '', renderer_context or {}):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode(self.charset)
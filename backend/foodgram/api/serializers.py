@@ -1,15 +1,49 @@
 import base64
+import binascii
+import hashlib
+import re
 
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from api.fragments import RecipeFragments
+from api.viewer import ViewerState
+from recipes.counters import change_counter
+from recipes.images import get_variant_urls
+from recipes.models import (FeedEntry, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingListItem, Tag)
+from recipes.search import highlight, update_search_index
 from users.models import User
 
 
+class ViewerListSerializer(serializers.ListSerializer):
+    """List serializer that loads viewer flags for the whole page
+    before serializing its items."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        self.child.prime_viewer(data)
+        return super().to_representation(data)
+
+
+class ViewerStateMixin:
+    """Access to the per-request `ViewerState` of the serializer."""
+
+    @property
+    def viewer(self):
+        return ViewerState.for_request(self.context['request'])
+
+    def prime_viewer(self, objs):
+        """Load viewer flags needed to serialize `objs`."""
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     """Serializer to work with custom User creation model."""
     class Meta:
@@ -18,7 +52,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
                   'password')
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(ViewerStateMixin, UserSerializer):
     """Serializer to work with custom User model."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -26,13 +60,16 @@ class CustomUserSerializer(UserSerializer):
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed')
+        list_serializer_class = ViewerListSerializer
+
+    def prime_viewer(self, objs):
+        self.viewer.prime(author_ids=[
+            obj.id for obj in objs if not hasattr(obj, 'is_subscribed')])
 
     def get_is_subscribed(self, obj):
-        if self.context['request'].user.is_authenticated:
-            user = get_object_or_404(
-                User, username=self.context['request'].user)
-            return user.follower.filter(author=obj.id).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return self.viewer.is_subscribed(obj.id)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -75,17 +112,88 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         }
 
 
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Resolves ingredient IDs of all items with one query."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ids = {item['ingredient']['id'] for item in items}
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = sorted(ids - ingredients.keys())
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, missing))}.')
+        for item in items:
+            item['ingredient']['id'] = ingredients[item['ingredient']['id']]
+        return items
+
+
+class IngredientAmountSerializer(IngredientRecipeSerializer):
+    """Ingredient row of a recipe write, validated without queries
+    per row."""
+    id = serializers.IntegerField(source='ingredient.id', min_value=1)
+
+    class Meta(IngredientRecipeSerializer.Meta):
+        list_serializer_class = IngredientAmountListSerializer
+
+
+class InBulkManyRelatedField(serializers.ManyRelatedField):
+    """Many related field resolving all primary keys with one query."""
+    default_error_messages = {
+        'does_not_exist': 'Объекты не найдены: {pk_values}.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        pk_field = serializers.IntegerField(min_value=1)
+        ids = list(dict.fromkeys(
+            pk_field.run_validation(pk) for pk in data))
+        objs = self.child_relation.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in objs]
+        if missing:
+            self.fail('does_not_exist',
+                      pk_values=', '.join(map(str, missing)))
+        return [objs[pk] for pk in ids]
+
+
 class Base64ImageField(serializers.ImageField):
+    """Image field accepting `data:image/<ext>;base64,...` strings.
+
+    Decoded images are named by the SHA-256 of their content, so the
+    same picture uploaded twice is stored once.
+    """
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} Мб.',
+        'invalid_base64': 'Изображение должно быть в формате base64.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            data = self.decode(data)
         return super().to_internal_value(data)
 
-
-class RecipeSerializer(serializers.ModelSerializer):
+    def decode(self, data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        try:
+            format, imgstr = data.split(';base64,')
+        except ValueError:
+            self.fail('invalid_base64')
+        if len(imgstr) * 3 // 4 > max_size:
+            self.fail('too_large', max_size=max_size // (1024 * 1024))
+        try:
+            content = base64.b64decode(imgstr, validate=True)
+        except binascii.Error:
+            self.fail('invalid_base64')
+        ext = re.sub(r'\W', '', format.split('/')[-1])[:10]
+        name = hashlib.sha256(content).hexdigest()
+        return ContentFile(content, name=f'{name}.{ext}')
+
+
+class RecipeSerializer(ViewerStateMixin, serializers.ModelSerializer):
     """Serializer to work with Recipe list/retrieve."""
     tags = TagSerializer(read_only=True, many=True)
     ingredients = IngredientRecipeSerializer(many=True,
@@ -95,38 +203,91 @@ class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
+        list_serializer_class = ViewerListSerializer
+
+    # Subclasses with other fields must not share the fragment cache.
+    cache_fragments = True
+
+    @property
+    def fragments(self):
+        request = self.context.get('request')
+        if not self.cache_fragments or request is None:
+            return None
+        return RecipeFragments.for_request(request)
+
+    def prime_viewer(self, objs):
+        if self.fragments is not None:
+            self.fragments.prime(objs)
+        objs = [obj for obj in objs if not hasattr(obj, 'is_favorited')]
+        self.viewer.prime(recipe_ids=[obj.id for obj in objs],
+                          author_ids=[obj.author_id for obj in objs])
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        fragments = self.fragments
+        if fragments is None:
+            data = super().to_representation(instance)
+        else:
+            data = fragments.get(instance)
+            if data is None:
+                data = super().to_representation(instance)
+                fragments.set(instance, data)
+            else:
+                data['is_favorited'] = self.get_is_favorited(instance)
+                data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(
+                    instance)
+                data['author']['is_subscribed'] = self.fields[
+                    'author'].get_is_subscribed(instance.author)
+        if hasattr(instance, 'search_rank'):
+            # Found by `search`: add highlighted matches, never cached.
+            data['search_highlight'] = {
+                'name': highlight(instance.search_name),
+                'text': highlight(instance.search_text),
+            }
+        return data
 
     def get_is_favorited(self, obj):
-        if self.context['request'].user.is_authenticated:
-            user = get_object_or_404(
-                User, username=self.context['request'].user)
-            return user.favorite.filter(recipe=obj.id).exists()
-        return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return self.viewer.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        if self.context['request'].user.is_authenticated:
-            user = get_object_or_404(
-                User, username=self.context['request'].user)
-            return user.cart.filter(recipe=obj.id).exists()
-        return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return self.viewer.is_in_shopping_cart(obj.id)
+
+    def get_image_variants(self, obj):
+        if not obj.image:
+            return None
+        request = self.context.get('request')
+        return {
+            variant: request.build_absolute_uri(url) if request else url
+            for variant, url in get_variant_urls(
+                obj.image, obj.image_variants_ready).items()}
 
 
 class RecipeCreateSerializer(RecipeSerializer):
     """Serializer to work with Recipe create."""
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
+    tags = InBulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()))
+    ingredients = IngredientAmountSerializer(many=True,
+                                             source='recipe_ingredients')
+    cache_fragments = False
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
         extra_kwargs = {
             'cooking_time': {
                 'min_value': None,
@@ -140,6 +301,11 @@ class RecipeCreateSerializer(RecipeSerializer):
             )
         ]
 
+    def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], *Recipe.objects.related_lookups())
+        return super().to_representation(instance)
+
     @staticmethod
     def save_ingredients(recipe, ingredients):
         ingredients_list = []
@@ -153,13 +319,61 @@ class RecipeCreateSerializer(RecipeSerializer):
                     amount=current_amount))
         IngredientRecipe.objects.bulk_create(ingredients_list)
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Add and remove only the tags that changed."""
+        Through = Recipe.tags.through
+        stored = set(Through.objects.filter(recipe=recipe).values_list(
+            'tag_id', flat=True))
+        wanted = {tag.id for tag in tags}
+        if stored - wanted:
+            Through.objects.filter(
+                recipe=recipe, tag_id__in=stored - wanted).delete()
+        Through.objects.bulk_create(
+            [Through(recipe=recipe, tag_id=tag_id)
+             for tag_id in wanted - stored])
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Insert, update and delete only the ingredient rows that
+        changed, return the changes of amounts by ingredient ID."""
+        stored = {row.ingredient_id: row
+                  for row in IngredientRecipe.objects.filter(recipe=recipe)}
+        wanted = {item['ingredient']['id'].id: item['amount']
+                  for item in ingredients}
+        old = {ingredient_id: row.amount
+               for ingredient_id, row in stored.items()}
+        removed = [row.id for ingredient_id, row in stored.items()
+                   if ingredient_id not in wanted]
+        changed = []
+        for ingredient_id, row in stored.items():
+            amount = wanted.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        added = [IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                                  amount=amount)
+                 for ingredient_id, amount in wanted.items()
+                 if ingredient_id not in stored]
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            IngredientRecipe.objects.bulk_create(added)
+        deltas = {ingredient_id: wanted.get(ingredient_id, 0)
+                  - old.get(ingredient_id, 0)
+                  for ingredient_id in old.keys() | wanted.keys()}
+        return {ingredient_id: delta for ingredient_id, delta
+                in deltas.items() if delta}
+
     def validate(self, data):
-        if data['cooking_time'] <= 0:
+        if 'cooking_time' in data and data['cooking_time'] <= 0:
             raise serializers.ValidationError('Время приготовления не может '
                                               'быть менее минуты.')
 
         ingredients_list = []
-        for ingredient in data['recipe_ingredients']:
+        for ingredient in data.get('recipe_ingredients', ()):
             if ingredient['amount'] <= 0:
                 raise serializers.ValidationError('Количество не может'
                                                   ' быть меньше 1.')
@@ -170,34 +384,49 @@ class RecipeCreateSerializer(RecipeSerializer):
                                               ' повторяться.')
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         ingredients = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data, author=author)
+        change_counter(author, 'recipes_count', 1)
+        FeedEntry.objects.fan_out(recipe)
+        update_search_index([recipe.id])
         recipe.tags.add(*tags)
         self.save_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.image = validated_data.get('image', instance.image)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time)
-        ingredients = validated_data.pop('recipe_ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.add(*tags)
-        instance.ingredients.clear()
-        recipe = instance
-        self.save_ingredients(recipe, ingredients)
-        instance.save()
+        """Save changed fields and apply the difference of tags and
+        ingredients. Relations missing from a partial update are not
+        touched."""
+        fields = [field for field in ('name', 'text', 'image', 'cooking_time')
+                  if field in validated_data]
+        for field in fields:
+            setattr(instance, field, validated_data[field])
+        if 'image' in fields:
+            instance.image_variants_ready = False
+            fields.append('image_variants_ready')
+        # Counters of the loaded instance may be behind concurrent F()
+        # updates, they are never written back.
+        instance.save(update_fields=fields + ['updated'])
+        if 'name' in validated_data or 'text' in validated_data:
+            update_search_index([instance.id])
+        if 'tags' in validated_data:
+            self.update_tags(instance, validated_data['tags'])
+        if 'recipe_ingredients' in validated_data:
+            ShoppingListItem.objects.change_recipe(
+                instance.id, self.update_ingredients(
+                    instance, validated_data['recipe_ingredients']))
         return instance
 
 
 class MiniRecipeSerializer(RecipeSerializer):
     """Serializer to work with MiniRecipe."""
+    cache_fragments = False
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'cooking_time', 'image')
@@ -205,11 +434,26 @@ class MiniRecipeSerializer(RecipeSerializer):
 
 class SubscriptionSerializer(CustomUserSerializer):
     """Serializer to work with Subscription model."""
-    recipes = MiniRecipeSerializer(read_only=True, many=True)
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = ViewerListSerializer
+
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+        return MiniRecipeSerializer(recipes, many=True,
+                                    context=self.context).data
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """IDs of objects for a batch action."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE)
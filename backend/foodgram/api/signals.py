@@ -0,0 +1,76 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.ingredient_index import ingredient_index
+from recipes.images import schedule_variants
+from recipes.models import Ingredient, Recipe, TableVersion, Tag
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_table_version(sender, **kwargs):
+    TableVersion.objects.bump(sender)
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or instance.image_variants_ready:
+        return
+    schedule_variants(instance.image)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if reverse and action == 'pre_clear':
+        instance.recipes.touch()
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+# Fields of the author serialized with their recipes.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def check_author_change(sender, instance, raw, update_fields, **kwargs):
+    instance._author_changed = False
+    if raw or instance.pk is None or (
+            update_fields is not None
+            and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    stored = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS).first()
+    instance._author_changed = stored != tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def touch_recipes_on_author_change(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_author_changed', False):
+        Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_token(sender, request, **kwargs):
+    if isinstance(getattr(request, 'auth', None), Token):
+        invalidate_tokens(request.auth.key)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (FavoriteViewSet, IngredientsViewSet, RecipesViewSet,
+from api.views import (FavoriteViewSet, IngredientsViewSet, MetricsView,
+                       RecipesViewSet, ReferenceCacheStatsView,
                        ShoppingCartViewSet, SubscriptionsViewSet, TagsViewSet)
 
 router = DefaultRouter()
@@ -13,6 +14,8 @@ router.register('tags', TagsViewSet)
 router.register('ingredients', IngredientsViewSet)
 
 urlpatterns = [
+    path('reference-cache/stats/', ReferenceCacheStatsView.as_view()),
+    path('metrics/', MetricsView.as_view()),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
@@ -1,25 +1,95 @@
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import sql
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import serializers
+from rest_framework.response import Response
 
-from recipes.models import Favorite, ShoppingCart
+from api.conditional import table_version
+from api.serializers import BatchIdsSerializer
+from recipes.counters import change_counter, change_counters
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem)
 from users.models import Subscription
 
 
-def get_cart_txt(ingredients):
-    """Function to generate txt file for shopping list."""
-    content_list = []
-    for ingredient in ingredients:
-        content_list.append(
-            f'{ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]}): '
-            f'{ingredient["total_amount"]}')
-    content = 'Ваш список покупок:\n\n' + '\n'.join(content_list)
-    filename = 'shopping_cart.txt'
-    file = HttpResponse(content, content_type='text/plain')
-    file['Content-Disposition'] = 'attachment; filename={0}'.format(
-        filename)
-    return file
+def get_cart_etag(request, file_format):
+    """Function to get a version stamp of the user's shopping list: a hash
+    of its (ingredient, amount) rows and of the ingredients version, so
+    renamed ingredients also change it."""
+    rows = ShoppingListItem.objects.filter(user=request.user).order_by(
+        'ingredient_id').values_list('ingredient_id', 'total_amount')
+    stamp = hashlib.md5(
+        f'{request.user.id}:{file_format}:'
+        f'{table_version(request, Ingredient).version}'.encode())
+    for ingredient_id, amount in rows.iterator():
+        stamp.update(f':{ingredient_id}={amount}'.encode())
+    return quote_etag(stamp.hexdigest())
+
+
+def _cache_stream(chunks, cache_key):
+    """Yield `chunks` and cache their concatenation once all of them
+    were sent, if it is small enough."""
+    content = []
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size <= settings.SHOPPING_CART_CACHE_MAX_SIZE:
+            content.append(chunk)
+        yield chunk
+    if size <= settings.SHOPPING_CART_CACHE_MAX_SIZE:
+        cache.set(cache_key, b''.join(content),
+                  settings.SHOPPING_CART_CACHE_TIMEOUT)
+
+
+def get_cart_file(request, ingredients):
+    """Function to generate shopping list file in the format chosen by
+    content negotiation (`?format=txt|csv|json`).
+
+    Rows are streamed as the query yields them. Unchanged lists get 304
+    for a matching `If-None-Match` or are served from the cache.
+    """
+    renderer = request.accepted_renderer
+    etag = get_cart_etag(request, renderer.format)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f'shopping-cart:{etag}'
+        content_type = f'{renderer.media_type}; charset={renderer.charset}'
+        content = cache.get(cache_key)
+        if content is None:
+            response = StreamingHttpResponse(
+                _cache_stream(renderer.stream(ingredients.iterator()),
+                              cache_key),
+                content_type=content_type)
+        else:
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Length'] = len(content)
+        filename = f'shopping_cart.{renderer.format}'
+        response['Content-Disposition'] = 'attachment; filename={0}'.format(
+            filename)
+    response['ETag'] = etag
+    return response
+
+
+def add_to_shopping_list(user, recipe_ids):
+    ShoppingListItem.objects.add_recipes(user, recipe_ids)
+
+
+def remove_from_shopping_list(user, recipe_ids):
+    ShoppingListItem.objects.remove_recipes(user, recipe_ids)
+
+
+def follow_feed(user, author_ids):
+    FeedEntry.objects.follow(user, author_ids)
+
+
+def unfollow_feed(user, author_ids):
+    FeedEntry.objects.unfollow(user, author_ids)
 
 
 MODELS = {
@@ -27,35 +97,188 @@ MODELS = {
         'name': 'author',
         'err_exist': 'Вы уже подписаны на этого пользователя!',
         'err_not_exist': 'Вы не подписаны на этого пользователя!',
+        'counter': 'followers_count',
+        'after_post': follow_feed,
+        'after_delete': unfollow_feed,
     },
     Favorite: {
         'name': 'recipe',
         'err_exist': 'Этот рецепт уже в избранном!',
         'err_not_exist': 'Этого рецепта нет в избранном!',
+        'counter': 'favorites_count',
     },
     ShoppingCart: {
         'name': 'recipe',
         'err_exist': 'Этот рецепт уже в корзине!',
         'err_not_exist': 'Этого рецепта нет в корзине!',
+        'counter': 'carts_count',
+        'after_post': add_to_shopping_list,
+        'after_delete': remove_from_shopping_list,
     },
 }
 
 
+def insert_ignoring_conflicts(model, **values):
+    """Insert a `model` row with one INSERT that skips unique conflicts,
+    return whether the row was created."""
+    using = router.db_for_write(model)
+    query = sql.InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(
+        [field for field in model._meta.concrete_fields
+         if not field.primary_key],
+        [model(**values)])
+    with connections[using].cursor() as cursor:
+        for statement, params in query.get_compiler(using).as_sql():
+            cursor.execute(statement, params)
+        return cursor.rowcount > 0
+
+
+@transaction.atomic
 def post_for_actions(user, obj, model):
     """Function for post request actions."""
     args = {MODELS[model]['name']: obj,
             'user': user}
-    post_obj = model(**args)
-    if model.objects.filter(**args).exists():
+    # The counter goes first: its UPDATE locks the row of `obj`, so that
+    # changes of the same object run one at a time. An error rolls it
+    # back.
+    change_counter(obj, MODELS[model]['counter'], 1)
+    if not insert_ignoring_conflicts(model, **args):
         raise serializers.ValidationError(MODELS[model]['err_exist'])
-    post_obj.save()
+    if 'after_post' in MODELS[model]:
+        MODELS[model]['after_post'](user, [obj.id])
 
 
+@transaction.atomic
 def delete_for_actions(user, obj, model):
     """Function for delete request actions."""
     args = {MODELS[model]['name']: obj,
             'user': user}
-    if not model.objects.filter(**args).exists():
+    change_counter(obj, MODELS[model]['counter'], -1)
+    deleted, _ = model.objects.filter(**args).delete()
+    if not deleted:
         raise serializers.ValidationError(MODELS[model]['err_not_exist'])
-    del_obj = get_object_or_404(model, **args)
-    del_obj.delete()
+    if 'after_delete' in MODELS[model]:
+        MODELS[model]['after_delete'](user, [obj.id])
+
+
+def _batch_errors(user, ids, model, add):
+    """Return error messages of the `ids` that can not be added to or
+    removed from `model` rows of `user`."""
+    name = MODELS[model]['name']
+    target = model._meta.get_field(name).related_model
+    found = set(target.objects.filter(pk__in=ids).values_list(
+        'pk', flat=True))
+    existing = set(model.objects.filter(
+        user=user, **{f'{name}__in': found}).values_list(
+            f'{name}_id', flat=True))
+    errors = {}
+    for pk in ids:
+        if pk not in found:
+            errors[pk] = 'Объект не найден.'
+        elif add and pk in existing:
+            errors[pk] = MODELS[model]['err_exist']
+        elif not add and pk not in existing:
+            errors[pk] = MODELS[model]['err_not_exist']
+        elif add and model is Subscription and pk == user.pk:
+            errors[pk] = 'Нельзя подписаться на самого себя!'
+    return errors
+
+
+@transaction.atomic
+def batch_for_actions(user, ids, model, add):
+    """Add (or remove) `model` rows of `user` for all `ids` at once.
+
+    The target rows are locked by an UPDATE of their counters first, so
+    changes of the same objects wait and the checks see their rows.
+    Targets and existing rows are checked with one query each and the
+    change is applied with one bulk statement. Return a per-ID status:
+    `created`/`deleted` or `error` with a message.
+    """
+    name = MODELS[model]['name']
+    ids = list(dict.fromkeys(ids))
+    target = model._meta.get_field(name).related_model
+    counter = MODELS[model]['counter']
+    change_counters(target.objects.filter(pk__in=ids), counter, 0)
+    errors = _batch_errors(user, ids, model, add)
+    changed = [pk for pk in ids if pk not in errors]
+    if add:
+        model.objects.bulk_create(
+            [model(user=user, **{f'{name}_id': pk}) for pk in changed],
+            ignore_conflicts=True)
+    else:
+        model.objects.filter(
+            user=user, **{f'{name}__in': changed}).delete()
+    if changed:
+        change_counters(target.objects.filter(pk__in=changed), counter,
+                        1 if add else -1)
+        hook = MODELS[model].get('after_post' if add else 'after_delete')
+        if hook is not None:
+            hook(user, changed)
+    status = 'created' if add else 'deleted'
+    return [{'id': pk, 'status': 'error', 'detail': errors[pk]}
+            if pk in errors else {'id': pk, 'status': status}
+            for pk in ids]
+
+
+def batch_action_response(request, model):
+    """Validate the `ids` list of a batch request and apply it: POST adds,
+    DELETE removes."""
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return Response(batch_for_actions(
+        request.user, serializer.validated_data['ids'], model,
+        add=request.method == 'POST'))
+
+
+@transaction.atomic
+def clear_shopping_cart(user):
+    """Remove all recipes from the user's cart, return their number."""
+    cart = ShoppingCart.objects.filter(user=user)
+    recipe_ids = list(cart.values_list('recipe_id', flat=True))
+    if not recipe_ids:
+        return 0
+    # Lock the recipes like other cart changes do, then remove only the
+    # rows still in the cart.
+    change_counters(Recipe.objects.filter(pk__in=recipe_ids),
+                    'carts_count', 0)
+    recipe_ids = list(cart.filter(recipe_id__in=recipe_ids).values_list(
+        'recipe_id', flat=True))
+    cart.filter(recipe_id__in=recipe_ids).delete()
+    change_counters(Recipe.objects.filter(pk__in=recipe_ids),
+                    'carts_count', -1)
+    ShoppingListItem.objects.remove_recipes(user, recipe_ids)
+    return len(recipe_ids)
+
+
+def get_recipes_limit(request):
+    """Return `recipes_limit` query param as a positive int or None."""
+    limit = request.query_params.get('recipes_limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Должно быть целым положительным числом.'})
+    return limit
+
+
+def attach_author_recipes(authors, limit=None):
+    """Load recipes of all `authors` with one query and store them in
+    `author.limited_recipes`."""
+    authors = list(authors)
+    recipes = Recipe.objects.only(
+        'id', 'author_id', 'name', 'image', 'cooking_time')
+    author_ids = [author.id for author in authors]
+    if limit is None:
+        recipes = recipes.filter(author_id__in=author_ids)
+    else:
+        recipes = recipes.latest_per_author(author_ids, limit)
+    by_author = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.limited_recipes = by_author[author.id]
+    return authors
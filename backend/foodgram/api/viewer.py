@@ -0,0 +1,82 @@
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+
+class ViewerState:
+    """Favorites, shopping cart and subscriptions of the current user.
+
+    Loaded at most once per request: either for the objects of the
+    current page via `prime` or, on first unprimed lookup, for the whole
+    user's set.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._sets = {
+            'favorites': _LazyIdSet(Favorite, 'recipe_id', user),
+            'cart': _LazyIdSet(ShoppingCart, 'recipe_id', user),
+            'following': _LazyIdSet(Subscription, 'author_id', user),
+        }
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the state cached on the request, creating it once."""
+        request = getattr(request, '_request', request)
+        state = getattr(request, '_viewer_state', None)
+        if state is None:
+            state = cls(request.user)
+            request._viewer_state = state
+        return state
+
+    def prime(self, recipe_ids=(), author_ids=()):
+        """Load flags only for the given recipes and authors."""
+        if not self.user.is_authenticated:
+            return
+        self._sets['favorites'].load(recipe_ids)
+        self._sets['cart'].load(recipe_ids)
+        self._sets['following'].load(author_ids)
+
+    def is_favorited(self, recipe_id):
+        return self._contains('favorites', recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self._contains('cart', recipe_id)
+
+    def is_subscribed(self, author_id):
+        return self._contains('following', author_id)
+
+    def _contains(self, name, obj_id):
+        if not self.user.is_authenticated:
+            return False
+        return self._sets[name].contains(obj_id)
+
+
+class _LazyIdSet:
+    """Set of related object IDs of a user, loaded on demand."""
+
+    def __init__(self, model, field, user):
+        self.model = model
+        self.field = field
+        self.user = user
+        self.ids = set()
+        self.loaded_for = set()
+        self.loaded_all = False
+
+    def load(self, obj_ids=None):
+        if self.loaded_all:
+            return
+        queryset = self.model.objects.filter(user=self.user)
+        if obj_ids is None:
+            self.loaded_all = True
+        else:
+            obj_ids = set(obj_ids) - self.loaded_for
+            if not obj_ids:
+                return
+            self.loaded_for |= obj_ids
+            queryset = queryset.filter(**{f'{self.field}__in': obj_ids})
+        self.ids.update(queryset.values_list(self.field, flat=True))
+
+    def contains(self, obj_id):
+        if not self.loaded_all and obj_id not in self.loaded_for:
+            self.load()
+        return obj_id in self.ids
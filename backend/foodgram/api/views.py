@@ -1,19 +1,35 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, serializers, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from api.conditional import (ingredient_etag, ingredient_last_modified,
+                             recipe_etag, tag_etag, tag_last_modified)
 from api.filters import RecipeFilter
+from api.ingredient_index import ingredient_index
+from api.metrics import render_prometheus
+from api.paginators import KeysetPagination
 from api.permissions import IsAuthorOrAdminOrReadOnly
+from api.reference_cache import cached_reference, get_stats
+from api.renderers import (PrometheusRenderer, ShoppingCartCSVRenderer,
+                           ShoppingCartJSONRenderer, ShoppingCartTxtRenderer)
 from api.serializers import (IngredientSerializer, MiniRecipeSerializer,
                              RecipeCreateSerializer, RecipeSerializer,
                              SubscriptionSerializer, TagSerializer)
-from api.utils import delete_for_actions, get_cart_txt, post_for_actions
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from api.utils import (attach_author_recipes, batch_action_response,
+                       clear_shopping_cart, delete_for_actions, get_cart_file,
+                       get_recipes_limit, post_for_actions)
+from recipes.counters import change_counter
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
 from users.models import Subscription, User
 
 
@@ -22,6 +38,8 @@ class SubscriptionsViewSet(viewsets.GenericViewSet):
     list of subscriptions."""
     serializer_class = SubscriptionSerializer
     queryset = User.objects.all()
+    cursor_ordering = ('id',)
+    personal_list = True
 
     @action(detail=False,
             permission_classes=[IsAuthenticated, ],
@@ -31,15 +49,24 @@ class SubscriptionsViewSet(viewsets.GenericViewSet):
         subscriptions = user.follower.all().values('author')
         result = User.objects.filter(id__in=subscriptions)
         page = self.paginate_queryset(result)
+        attach_author_recipes(page, get_recipes_limit(request))
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='subscribe',
+            permission_classes=[IsAuthenticated, ])
+    def subscribe_batch(self, request):
+        return batch_action_response(request, Subscription)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthorOrAdminOrReadOnly, ])
     def subscribe(self, request, pk):
         user = self.request.user
         author = get_object_or_404(User, pk=pk)
+        attach_author_recipes([author], get_recipes_limit(request))
         serializer = self.get_serializer(author)
 
         if self.request.method == 'POST':
@@ -56,40 +83,138 @@ class SubscriptionsViewSet(viewsets.GenericViewSet):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(condition(tag_etag, tag_last_modified), 'list')
+@method_decorator(condition(tag_etag, tag_last_modified), 'retrieve')
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     """Viewset to work with tags."""
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
 
+    @cached_reference(Tag)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_reference(Tag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
+
+@method_decorator(
+    condition(ingredient_etag, ingredient_last_modified), 'list')
+@method_decorator(
+    condition(ingredient_etag, ingredient_last_modified), 'retrieve')
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
-    """Viewset to work with ingredients."""
+    """Viewset to work with ingredients.
+
+    Name prefix search is answered from the in-memory ingredient index,
+    falling back to the database while the index is cold.
+    """
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
 
+    @cached_reference(Ingredient)
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = self.get_search_limit()
+        results = ingredient_index.search(name, limit)
+        if results is None:
+            queryset = self.filter_queryset(self.get_queryset())[:limit]
+            results = self.get_serializer(queryset, many=True).data
+        return Response(results)
+
+    @cached_reference(Ingredient)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_search_limit(self):
+        limit = settings.INGREDIENTS_SEARCH_LIMIT
+        try:
+            return min(int(self.request.query_params['limit']), limit)
+        except (KeyError, ValueError):
+            return limit
+
+
+class ReferenceCacheStatsView(APIView):
+    """Hit and miss counters of the tag and ingredient response cache
+    in the process that serves the request."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    """Request timing histograms of the serving process for
+    Prometheus."""
+    permission_classes = [IsAdminUser, ]
+    renderer_classes = [PrometheusRenderer, ]
+
+    def get(self, request):
+        return Response(render_prometheus())
+
 
+@method_decorator(condition(etag_func=recipe_etag), 'retrieve')
 class RecipesViewSet(viewsets.ModelViewSet):
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrAdminOrReadOnly, ]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cursor_ordering = ('-created', '-id')
+    cursor_conflicts = ('search', 'ordering')
+    personal_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_queryset(self):
+        return super().get_queryset().with_related().with_user_flags(
+            self.request.user)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        user_ids = list(instance.cart.values_list('user_id', flat=True))
+        instance.delete()
+        change_counter(instance.author, 'recipes_count', -1)
+        ShoppingListItem.objects.rebuild(user_ids)
 
     def get_serializer_class(self):
-        if self.action in ['create', 'partial_update']:
+        if self.action in ['create', 'update', 'partial_update']:
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    @action(detail=False,
+            permission_classes=[IsAuthenticated, ],
+            )
+    def feed(self, request):
+        """Recipes of followed authors, newest first, in cursor pages."""
+        keyset = KeysetPagination(
+            self.cursor_ordering, self.paginator.get_page_size(request),
+            self.paginator.cursor_query_param)
+        recipe_ids = FeedEntry.objects.recipe_ids(
+            request.user, keyset.get_position(request, Recipe),
+            keyset.page_size + 1)
+        page = keyset.paginate_queryset(
+            self.get_queryset().filter(pk__in=recipe_ids), request)
+        serializer = self.get_serializer(page, many=True)
+        return keyset.get_paginated_response(serializer.data)
+
 
 class FavoriteViewSet(viewsets.GenericViewSet):
     """Viewset for users favorite recipes."""
     serializer_class = MiniRecipeSerializer
     queryset = Recipe.objects.all()
 
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite',
+            permission_classes=[IsAuthenticated, ])
+    def favorite_batch(self, request):
+        return batch_action_response(request, Favorite)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthorOrAdminOrReadOnly, ])
@@ -114,6 +239,21 @@ class ShoppingCartViewSet(viewsets.GenericViewSet):
     serializer_class = MiniRecipeSerializer
     queryset = Recipe.objects.all()
 
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='shopping_cart',
+            permission_classes=[IsAuthenticated, ])
+    def shopping_cart_batch(self, request):
+        return batch_action_response(request, ShoppingCart)
+
+    @action(detail=False,
+            methods=['delete'],
+            url_path='shopping_cart/clear',
+            permission_classes=[IsAuthenticated, ])
+    def clear_cart(self, request):
+        clear_shopping_cart(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthorOrAdminOrReadOnly, ])
@@ -134,10 +274,14 @@ class ShoppingCartViewSet(viewsets.GenericViewSet):
     @action(detail=False,
             methods=['get', ],
             permission_classes=[IsAuthenticated, ],
+            renderer_classes=[ShoppingCartTxtRenderer,
+                              ShoppingCartCSVRenderer,
+                              ShoppingCartJSONRenderer],
             )
     def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__cart__user=request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-                total_amount=Sum('amount'))
-        return get_cart_txt(ingredients)
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount').order_by(
+                'ingredient__name', 'ingredient__measurement_unit')
+        return get_cart_file(request, ingredients)
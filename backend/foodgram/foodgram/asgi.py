@@ -0,0 +1,46 @@
+"""
+ASGI config for foodgram project.
+
+Django 2.2 has no native ASGI support, so the WSGI application is wrapped
+with asgiref. Request bodies are read and responses written by the event
+loop of the ASGI server, so slow clients and uploads do not hold a Django
+thread; each request runs in the thread pool once its body has arrived.
+"""
+
+import os
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+def closing(wsgi_application):
+    """Call `close()` of responses, which the asgiref wrapper does not,
+    so Django sends `request_finished` and cleans up DB connections."""
+    def application(environ, start_response):
+        response = wsgi_application(environ, start_response)
+        try:
+            yield from response
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+    return application
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps in one shared thread by default.
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+        thread_sensitive=False)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(self.wsgi_application)(
+            scope, receive, send)
+
+
+application = ThreadPoolWsgiToAsgi(closing(get_wsgi_application()))
@@ -0,0 +1,105 @@
+"""Read replica routing and connection checks.
+
+`ReplicaRouter` sends reads to the `replica` database only while
+`DatabaseRoutingMiddleware` marks the current request as a safe API read.
+A request that writes is served by the primary from then on, and the
+client gets a cookie pinning it to the primary for `REPLICA_PIN_SECONDS`
+so it reads its own writes despite replication lag.
+"""
+import contextlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+PIN_COOKIE = 'db_primary'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+_state = threading.local()
+
+
+def _flag_writes(execute, sql, params, many, context):
+    """Remember that the request changed data. Routing alone does not
+    tell: `select_for_update()` and `get_or_create()` ask for the write
+    database and may not write anything."""
+    if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        _state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def _use_replica():
+    return (getattr(_state, 'use_replica', False)
+            and not getattr(_state, 'wrote', False))
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return 'replica' if _use_replica() else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class DatabaseRoutingMiddleware:
+    """Choose the database for the request and, with
+    `DB_CONN_HEALTH_CHECKS`, drop broken persistent connections.
+
+    Only connections idle for over `DB_CONN_HEALTH_CHECK_IDLE` seconds
+    are checked, so busy workers do not pay a round trip per request.
+    Connections that raised errors are already checked by Django at the
+    end of the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.DB_CONN_HEALTH_CHECKS:
+            self.check_connections()
+        _state.use_replica = (
+            'replica' in settings.DATABASES
+            and request.method in ('GET', 'HEAD', 'OPTIONS')
+            and request.path.startswith('/api/')
+            and PIN_COOKIE not in request.COOKIES)
+        _state.wrote = False
+        try:
+            with contextlib.ExitStack() as stack:
+                if 'replica' in settings.DATABASES:
+                    stack.enter_context(
+                        connections['default'].execute_wrapper(_flag_writes))
+                response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.use_replica = _state.wrote = False
+            if settings.DB_CONN_HEALTH_CHECKS:
+                self.mark_used()
+        if wrote and 'replica' in settings.DATABASES:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    @staticmethod
+    def check_connections():
+        last_used = getattr(_state, 'last_used', {})
+        idle_since = time.monotonic() - settings.DB_CONN_HEALTH_CHECK_IDLE
+        for connection in connections.all():
+            if (connection.connection is not None
+                    and last_used.get(connection.alias, 0) < idle_since
+                    and not connection.is_usable()):
+                connection.close()
+
+    @staticmethod
+    def mark_used():
+        now = time.monotonic()
+        _state.last_used = {
+            connection.alias: now for connection in connections.all()
+            if connection.connection is not None}
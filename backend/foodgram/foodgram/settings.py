@@ -30,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'foodgram.db.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,10 +69,33 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Seconds to keep a connection open, 0 closes it after each request.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # PgBouncer in transaction mode can not keep server-side cursors.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', default='False') == 'True',
+        # SQLite tests run in memory unless a file is given.
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
     }
 }
 
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        HOST=os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        PORT=os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_ROUTERS = ['foodgram.db.ReplicaRouter']
+
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='False') == 'True'
+DB_CONN_HEALTH_CHECK_IDLE = int(
+    os.getenv('DB_CONN_HEALTH_CHECK_IDLE', default=10))
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,7 +129,12 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 
     "DEFAULT_PAGINATION_CLASS":
@@ -113,6 +143,78 @@ REST_FRAMEWORK = {
     "SEARCH_PARAM": "name",
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Pre-rendered tag and ingredient responses. LocMemCache is a bounded
+    # LRU of this process; point it at a shared backend if needed.
+    'reference': {
+        'BACKEND': os.getenv(
+            'REFERENCE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('REFERENCE_CACHE_LOCATION', default='reference'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('REFERENCE_CACHE_MAX_ENTRIES', default=512)),
+        },
+    },
+    # Viewer-independent JSON of serialized recipes.
+    'fragments': {
+        'BACKEND': os.getenv(
+            'RECIPE_FRAGMENT_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv(
+            'RECIPE_FRAGMENT_CACHE_LOCATION', default='fragments'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('RECIPE_FRAGMENT_CACHE_MAX_ENTRIES', default=5000)),
+        },
+    },
+    # User ids of authentication tokens.
+    'auth': {
+        'BACKEND': os.getenv(
+            'AUTH_TOKEN_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('AUTH_TOKEN_CACHE_LOCATION', default='auth'),
+        'TIMEOUT': int(os.getenv('AUTH_TOKEN_CACHE_TTL', default=60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', default=1000)),
+        },
+    },
+}
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=60))
+
+INGREDIENTS_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENTS_SEARCH_LIMIT', default=50))
+INGREDIENTS_INDEX_TTL = int(os.getenv('INGREDIENTS_INDEX_TTL', default=300))
+
+SHOPPING_CART_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_CART_CACHE_TIMEOUT', default=600))
+SHOPPING_CART_CACHE_MAX_SIZE = 256 * 1024
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', default=100))
+
+# Authors over these limits are read into feeds instead of being copied
+# into timelines of their followers.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=1000))
+FEED_FANOUT_MAX_RECIPES = int(
+    os.getenv('FEED_FANOUT_MAX_RECIPES', default=1000))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=5 * 1024 * 1024))
+RECIPE_IMAGE_VARIANTS = {'list': 480, 'detail': 1200}
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+# Share of API requests timed by `api.metrics.MetricsMiddleware`.
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', default=0.1))
+
 DJOSER = {
     'SERIALIZERS':
         {'user_create': 'api.serializers.CustomUserCreateSerializer',
@@ -0,0 +1,15 @@
+"""Gunicorn settings, overridable with environment variables.
+
+WSGI (default):
+    gunicorn foodgram.wsgi:application -c gunicorn.conf.py
+ASGI:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+    gunicorn foodgram.asgi:application -c gunicorn.conf.py
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 2))
@@ -1,7 +1,47 @@
 from django.contrib import admin
+from django.db import transaction
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.counters import CounterSyncMixin
+from recipes.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import filter_matches, update_search_index
+
+
+class ShoppingListSyncMixin:
+    """Rebuild shopping lists of users affected by admin changes.
+
+    `get_shopping_list_users` returns IDs of users whose shopping
+    lists depend on the given objects.
+    """
+
+    def get_shopping_list_users(self, objs):
+        raise NotImplementedError
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        user_ids = set()
+        if change:
+            user_ids.update(self.get_shopping_list_users(
+                [type(obj).objects.get(pk=obj.pk)]))
+        super().save_model(request, obj, form, change)
+        request.shopping_list_users = user_ids
+
+    @transaction.atomic
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        user_ids = getattr(request, 'shopping_list_users', set())
+        user_ids.update(self.get_shopping_list_users([form.instance]))
+        ShoppingListItem.objects.rebuild(user_ids)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        user_ids = set(self.get_shopping_list_users(queryset))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(user_ids)
 
 
 class IngredienRecipeInline(admin.TabularInline):
@@ -11,22 +51,51 @@ class IngredienRecipeInline(admin.TabularInline):
     extra = 0
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CounterSyncMixin, ShoppingListSyncMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'name',
                     'author',
                     'qty_of_favorites',
                     )
     list_editable = ('name', 'author')
-    search_fields = ('name', 'author', 'author__first_name', 'author__email')
+    readonly_fields = Recipe.counter_fields
+    search_fields = ('author__username', 'author__first_name',
+                     'author__email')
     list_filter = ('tags',)
     empty_value_display = '-пусто-'
     inlines = (IngredienRecipeInline,)
 
     def qty_of_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     qty_of_favorites.short_description = 'Количество в избранном'
+    qty_of_favorites.admin_order_field = 'favorites_count'
+
+    def get_counter_objects(self, obj):
+        return [], [obj.author_id]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Find recipes by author fields or by the full-text index of
+        name and text."""
+        results, use_distinct = super().get_search_results(
+            request, queryset, search_term)
+        if search_term:
+            results |= filter_matches(queryset, search_term)
+        return results, use_distinct
+
+    def get_shopping_list_users(self, objs):
+        return ShoppingCart.objects.filter(recipe__in=objs).values_list(
+            'user_id', flat=True)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_variants_ready = False
+        super().save_model(request, obj, form, change)
+        if change:
+            FeedEntry.objects.filter(recipe=obj).delete()
+        FeedEntry.objects.fan_out(obj)
+        update_search_index([obj.pk])
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -46,7 +115,7 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(ShoppingListSyncMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'recipe',
                     'ingredient',
@@ -55,8 +124,27 @@ class IngredientRecipeAdmin(admin.ModelAdmin):
     list_editable = ('ingredient', 'amount')
     search_fields = ('ingredient',)
 
+    def get_shopping_list_users(self, objs):
+        return ShoppingCart.objects.filter(
+            recipe__recipe_ingredients__in=objs).values_list(
+                'user_id', flat=True)
 
-class FavoriteAndCartAdmin(admin.ModelAdmin):
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(type(obj).objects.get(pk=obj.pk).recipe_id)
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+
+
+class FavoriteAndCartAdmin(CounterSyncMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'user',
                     'recipe',
@@ -64,10 +152,19 @@ class FavoriteAndCartAdmin(admin.ModelAdmin):
     list_editable = ('user', 'recipe',)
     list_filter = ('user',)
 
+    def get_counter_objects(self, obj):
+        return [obj.recipe_id], []
+
+
+class ShoppingCartAdmin(ShoppingListSyncMixin, FavoriteAndCartAdmin):
+
+    def get_shopping_list_users(self, objs):
+        return [obj.user_id for obj in objs]
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Favorite, FavoriteAndCartAdmin)
-admin.site.register(ShoppingCart, FavoriteAndCartAdmin)
+admin.site.register(ShoppingCart, ShoppingCartAdmin)
 admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
@@ -0,0 +1,106 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def change_counters(queryset, field, delta):
+    """Atomically add `delta` to the `field` counter of rows of
+    `queryset`, not going below zero if the counter has drifted."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def change_counter(obj, field, delta):
+    """Atomically add `delta` to the `field` counter of `obj`."""
+    change_counters(type(obj).objects.filter(pk=obj.pk), field, delta)
+
+
+def _count(model, field):
+    """Subquery counting `model` rows whose `field` is the outer row."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()), 0)
+
+
+def recount_recipes(recipe_ids=None, using=DEFAULT_DB_ALIAS):
+    """Recompute stored counters of recipes, return number of fixed
+    rows."""
+    recipes = Recipe.objects.using(using)
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    return _recount(recipes, {
+        'favorites_count': _count(Favorite, 'recipe'),
+        'carts_count': _count(ShoppingCart, 'recipe'),
+    })
+
+
+def recount_users(user_ids=None, using=DEFAULT_DB_ALIAS):
+    """Recompute stored counters of users, return number of fixed
+    rows."""
+    users = User.objects.using(using)
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    return _recount(users, {
+        'recipes_count': _count(Recipe, 'author'),
+        'followers_count': _count(Subscription, 'author'),
+    })
+
+
+def _recount(queryset, counters):
+    drifted = Q()
+    for field in counters:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    with transaction.atomic(using=queryset.db):
+        ids = list(queryset.annotate(**{
+            f'actual_{field}': expression
+            for field, expression in counters.items()
+        }).filter(drifted).values_list('pk', flat=True))
+        if ids:
+            rows = queryset.model.objects.using(queryset.db).filter(
+                pk__in=ids)
+            # Toggles update counters before changing their rows, so once
+            # the counters are locked, counts seen by the next statement
+            # stay exact till the commit.
+            list(rows.select_for_update().order_by('pk').values_list(
+                'pk', flat=True))
+            rows.update(**counters)
+    return len(ids)
+
+
+class CounterSyncMixin:
+    """Recount stored counters touched by admin changes.
+
+    `get_counter_objects` returns a pair of (recipe IDs, user IDs) whose
+    counters depend on the given object.
+    """
+
+    def get_counter_objects(self, obj):
+        raise NotImplementedError
+
+    def recount(self, objs):
+        recipe_ids, user_ids = set(), set()
+        for obj in objs:
+            recipes, users = self.get_counter_objects(obj)
+            recipe_ids.update(recipes)
+            user_ids.update(users)
+        recount_recipes(recipe_ids)
+        recount_users(user_ids)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        old = [type(obj).objects.get(pk=obj.pk)] if change else []
+        super().save_model(request, obj, form, change)
+        self.recount(old + [obj])
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        objs = list(queryset)
+        super().delete_queryset(request, queryset)
+        self.recount(objs)
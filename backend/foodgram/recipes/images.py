@@ -0,0 +1,86 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images')
+
+
+def variant_name(name, variant):
+    """Storage name of a resized WebP variant of the image `name`."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'recipes/variants/{stem}_{variant}.webp'
+
+
+def generate_variants(storage, name):
+    """Write missing resized variants of the stored image `name`,
+    return whether any were written."""
+    missing = {
+        variant: size
+        for variant, size in settings.RECIPE_IMAGE_VARIANTS.items()
+        if not storage.exists(variant_name(name, variant))}
+    if not missing:
+        return False
+    with storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for variant, size in missing.items():
+            resized = image.copy()
+            resized.thumbnail((size, size))
+            content = BytesIO()
+            resized.save(content, 'WEBP', quality=80)
+            storage.save(variant_name(name, variant),
+                         ContentFile(content.getvalue()))
+    return True
+
+
+def mark_variants_ready(name):
+    """Flag recipes with the image `name` as having all variants."""
+    # Variant URLs are part of the payload, refresh validators.
+    Recipe.objects.filter(image=name, image_variants_ready=False).update(
+        image_variants_ready=True, updated=timezone.now())
+
+
+def _generate_safely(storage, name):
+    # Pool threads live outside the request cycle, which otherwise closes
+    # expired and broken connections.
+    close_old_connections()
+    try:
+        generate_variants(storage, name)
+        mark_variants_ready(name)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(image):
+    """Generate variants of the `image` field file in the worker pool
+    once the current transaction commits."""
+    if not image:
+        return
+    storage, name = image.storage, image.name
+    transaction.on_commit(
+        lambda: executor.submit(_generate_safely, storage, name))
+
+
+def get_variant_urls(image, ready):
+    """URLs of the variants of the `image` field file, or of the original
+    while the variants are not `ready`."""
+    return {
+        variant: image.storage.url(
+            variant_name(image.name, variant) if ready else image.name)
+        for variant in settings.RECIPE_IMAGE_VARIANTS}
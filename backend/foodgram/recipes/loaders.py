@@ -0,0 +1,163 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from recipes.models import TableVersion
+
+CHUNK_SIZE = 64 * 1024
+# Models without counters, shopping lists, feeds or search index rows
+# derived from them, which bulk inserts would leave behind.
+REFERENCE_MODELS = ('recipes.Tag', 'recipes.Ingredient')
+
+
+class _JSONStream:
+    """Buffered reader of JSON values from a text file."""
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        chunk = self.file.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer += chunk
+
+    def peek(self):
+        """Return the next non-whitespace character, '' at the end."""
+        self.buffer = self.buffer.lstrip()
+        while not self.buffer and not self.eof:
+            self.fill()
+            self.buffer = self.buffer.lstrip()
+        return self.buffer[:1]
+
+    def skip(self):
+        self.buffer = self.buffer[1:]
+
+    def decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A value ending the buffer may be a truncated number.
+                if end < len(self.buffer) or self.eof:
+                    self.buffer = self.buffer[end:]
+                    return value
+            self.fill()
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Yield items of a top-level JSON array without reading the whole
+    file into memory."""
+    stream = _JSONStream(file, chunk_size)
+    if stream.peek() != '[':
+        raise ValueError('Ожидался JSON-массив.')
+    stream.skip()
+    while True:
+        char = stream.peek()
+        if char == ']':
+            return
+        if not char:
+            raise ValueError('Неожиданный конец JSON-массива.')
+        if char == ',':
+            stream.skip()
+            continue
+        yield stream.decode()
+
+
+def iter_csv(file, fieldnames=None):
+    """Yield rows of a CSV file as dicts."""
+    return csv.DictReader(file, fieldnames=fieldnames)
+
+
+def _fixture_rows(model, rows):
+    """Turn objects of a Django fixture ({"model", "pk", "fields"}) into
+    rows of field values, skipping objects of other models. Other rows
+    pass as they are."""
+    label = model._meta.label_lower
+    for row in rows:
+        if isinstance(row, dict) and {'model', 'fields'} <= row.keys():
+            if row['model'].lower() != label:
+                continue
+            fields = dict(row['fields'])
+            if row.get('pk') is not None:
+                fields[model._meta.pk.attname] = row['pk']
+            row = fields
+        yield row
+
+
+def _build(model, fields, row):
+    """Model instance of `row`. Foreign keys are given by IDs, under the
+    field name or the column attribute such as `recipe_id`."""
+    if not isinstance(row, dict):
+        raise ValueError(f'Ожидался объект, получено: {row!r}')
+    return model(**{fields[key]: value for key, value in row.items()
+                    if key in fields})
+
+
+def _check(obj, required, checked, row):
+    """Raise ValueError for values breaking NOT NULL or CHECK constraints.
+    INSERT OR IGNORE of SQLite skips such rows silently, as if they were
+    duplicates."""
+    for field in required:
+        if getattr(obj, field.attname) is None:
+            raise ValueError(f'Не задано поле {field.name}: {row!r}')
+    for field in checked:
+        value = getattr(obj, field.attname)
+        if value is not None:
+            try:
+                field.clean(value, obj)
+            except ValidationError as error:
+                raise ValueError(
+                    f'Поле {field.name}: {"; ".join(error.messages)} '
+                    f'{row!r}')
+    return obj
+
+
+def load_rows(model, rows, batch_size=1000, progress=None,
+              using=DEFAULT_DB_ALIAS):
+    """Insert `rows` (dicts of field values or objects of a Django
+    fixture) into `model` in batches. Signals are not sent, so counters
+    and other data derived from the rows are not updated.
+
+    Rows that violate unique constraints of `model` are skipped, so
+    loading the same file again is a no-op; missing required values and
+    values out of range raise ValueError. `progress` is called after
+    each batch with the number of rows read so far and seconds spent.
+    Return (rows read, rows inserted, seconds spent).
+    """
+    concrete_fields = model._meta.concrete_fields
+    fields = {name: field.attname for field in concrete_fields
+              for name in (field.name, field.attname)}
+    required = [field for field in concrete_fields
+                if not field.null and not field.primary_key]
+    checked = [field for field in concrete_fields
+               if field.db_check(connections[using]) is not None]
+    manager = model.objects.db_manager(using)
+    rows = _fixture_rows(model, rows)
+    started = time.monotonic()
+    total_before = manager.count()
+    read = 0
+    while True:
+        batch = [_check(_build(model, fields, row), required, checked, row)
+                 for row in islice(rows, batch_size)]
+        if not batch:
+            break
+        with transaction.atomic(using=using):
+            manager.bulk_create(batch, ignore_conflicts=True)
+        read += len(batch)
+        if progress is not None:
+            progress(read, time.monotonic() - started)
+    inserted = manager.count() - total_before
+    if inserted:
+        TableVersion.objects.db_manager(using).bump(model)
+    return read, inserted, time.monotonic() - started
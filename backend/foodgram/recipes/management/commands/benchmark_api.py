@@ -0,0 +1,308 @@
+import base64
+import contextlib
+import json
+import statistics
+import time
+from collections import namedtuple
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.urls import URLResolver
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api import urls
+from api.metrics import RequestMetrics
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PASSWORD = 'benchmark-password'
+
+# Djoser actions that send emails or need tokens from them.
+SKIPPED = {
+    'user-activation', 'user-resend-activation', 'user-reset-password',
+    'user-reset-password-confirm', 'user-reset-username',
+    'user-reset-username-confirm', 'user-set-username',
+}
+
+Case = namedtuple('Case', 'url_name label request setup')
+Case.__new__.__defaults__ = (None,)
+
+
+def url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_names(pattern.url_patterns)
+        else:
+            yield pattern.name or str(pattern.pattern)
+
+
+class Command(BaseCommand):
+    help = ('Time every endpoint of api/urls.py with the test client and '
+            'count its SQL queries. Changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого идут запросы. По умолчанию '
+                 'автор с наибольшим числом рецептов.')
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.')
+        parser.add_argument(
+            '--baseline',
+            help='JSON-файл прошлого запуска для сравнения.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Доля замедления, которая считается регрессией.')
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(error)
+        with transaction.atomic():
+            self.prepare(options['user'])
+            cases = self.cases()
+            self.stdout.write(
+                f'Пользователь {self.user.username}, повторов '
+                f'{options["repeat"]}.')
+            results = {}
+            for case in cases:
+                results[case.label] = self.measure(case, options['repeat'])
+                self.report(case.label, results[case.label],
+                            baseline.get(case.label), options['threshold'])
+            transaction.set_rollback(True)
+        covered = {case.url_name for case in cases} | SKIPPED
+        missing = sorted(set(url_names(urls.urlpatterns)) - covered)
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'Не измеряются: {", ".join(missing)}'))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def prepare(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            self.user = users.filter(username=username).first()
+        else:
+            self.user = users.exclude(recipes=None).order_by(
+                '-recipes_count', 'id').first()
+        if self.user is None:
+            raise CommandError('Нет подходящего пользователя, создайте '
+                               'данные командой generate_data.')
+        self.user.set_password(PASSWORD)
+        self.user.save()
+        self.admin = User.objects.create(
+            username='benchmark-admin', email='benchmark-admin@example.com',
+            is_staff=True, is_superuser=True)
+        self.anonymous = Client()
+        self.client = self.token_client(self.user)
+        self.admin_client = self.token_client(self.admin)
+
+        # Objects the user has not added yet, so that adding succeeds.
+        recipes = Recipe.objects.exclude(author=self.user).exclude(
+            favorite__user=self.user).exclude(cart__user=self.user)
+        authors = User.objects.exclude(pk=self.user.pk).exclude(
+            following__user=self.user)
+        self.recipe = recipes.order_by('-favorites_count', '-id').first()
+        self.own_recipe = self.user.recipes.order_by('-id').first()
+        self.author = authors.exclude(recipes=None).order_by(
+            '-followers_count', 'id').first()
+        self.tag = Tag.objects.order_by('id').first()
+        self.ingredient = Ingredient.objects.order_by('id').first()
+        if None in (self.recipe, self.author, self.tag, self.ingredient):
+            raise CommandError('Недостаточно данных для замеров, создайте '
+                               'их командой generate_data.')
+        self.recipe_ids = list(recipes.order_by('-id').values_list(
+            'id', flat=True)[:10])
+        self.author_ids = list(authors.order_by('-id').values_list(
+            'id', flat=True)[:10])
+
+    @staticmethod
+    def token_client(user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def recipe_payload(self, name):
+        content = BytesIO()
+        Image.new('RGB', (64, 64), (73, 182, 78)).save(content, 'PNG')
+        image = base64.b64encode(content.getvalue()).decode()
+        return json.dumps({
+            'name': name,
+            'text': 'Рецепт для замеров.',
+            'cooking_time': 10,
+            'image': f'data:image/png;base64,{image}',
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 100}],
+        })
+
+    def cases(self):
+        user, admin, anonymous = self.client, self.admin_client, self.anonymous
+        recipe, author = self.recipe.id, self.author.id
+        own = self.own_recipe.id
+        recipe_ids = json.dumps({'ids': self.recipe_ids})
+        author_ids = json.dumps({'ids': self.author_ids})
+        created = self.recipe_payload('Рецепт для замеров')
+        changed = json.dumps({'cooking_time': 15})
+        as_json = {'content_type': 'application/json'}
+
+        def fill_cart():
+            user.post('/api/recipes/shopping_cart/', recipe_ids, **as_json)
+
+        return [
+            Case('api-root', 'GET /api/',
+                 lambda: anonymous.get('/api/')),
+            Case('recipe-list', 'GET /api/recipes/ (аноним)',
+                 lambda: anonymous.get('/api/recipes/')),
+            Case('recipe-list', 'GET /api/recipes/',
+                 lambda: user.get('/api/recipes/')),
+            Case('recipe-list', 'GET /api/recipes/?tags=',
+                 lambda: user.get(f'/api/recipes/?tags={self.tag.slug}')),
+            Case('recipe-list', 'GET /api/recipes/?is_favorited=1',
+                 lambda: user.get('/api/recipes/?is_favorited=1')),
+            Case('recipe-list', 'GET /api/recipes/?is_in_shopping_cart=1',
+                 lambda: user.get('/api/recipes/?is_in_shopping_cart=1')),
+            Case('recipe-list', 'GET /api/recipes/?ordering=popular',
+                 lambda: user.get('/api/recipes/?ordering=popular')),
+            Case('recipe-list', 'GET /api/recipes/?search=',
+                 lambda: user.get('/api/recipes/?search=салат')),
+            Case('recipe-feed', 'GET /api/recipes/feed/',
+                 lambda: user.get('/api/recipes/feed/')),
+            Case('recipe-list', 'POST /api/recipes/',
+                 lambda: user.post('/api/recipes/', created, **as_json)),
+            Case('recipe-detail', 'GET /api/recipes/{id}/',
+                 lambda: user.get(f'/api/recipes/{recipe}/')),
+            Case('recipe-detail', 'PATCH /api/recipes/{id}/',
+                 lambda: user.patch(f'/api/recipes/{own}/', changed,
+                                    **as_json)),
+            Case('recipe-detail', 'DELETE /api/recipes/{id}/',
+                 lambda: user.delete(f'/api/recipes/{own}/')),
+            Case('favorite-favorite', 'POST /api/recipes/{id}/favorite/',
+                 lambda: user.post(f'/api/recipes/{recipe}/favorite/')),
+            Case('favorite-favorite', 'DELETE /api/recipes/{id}/favorite/',
+                 lambda: user.delete(f'/api/recipes/{recipe}/favorite/'),
+                 lambda: user.post(f'/api/recipes/{recipe}/favorite/')),
+            Case('favorite-favorite-batch', 'POST /api/recipes/favorite/',
+                 lambda: user.post('/api/recipes/favorite/', recipe_ids,
+                                   **as_json)),
+            Case('shopping_cart-shopping-cart',
+                 'POST /api/recipes/{id}/shopping_cart/',
+                 lambda: user.post(f'/api/recipes/{recipe}/shopping_cart/')),
+            Case('shopping_cart-shopping-cart-batch',
+                 'POST /api/recipes/shopping_cart/',
+                 lambda: user.post('/api/recipes/shopping_cart/',
+                                   recipe_ids, **as_json)),
+            Case('shopping_cart-download-shopping-cart',
+                 'GET /api/recipes/download_shopping_cart/',
+                 lambda: user.get('/api/recipes/download_shopping_cart/'),
+                 fill_cart),
+            Case('shopping_cart-clear-cart',
+                 'DELETE /api/recipes/shopping_cart/clear/',
+                 lambda: user.delete('/api/recipes/shopping_cart/clear/'),
+                 fill_cart),
+            Case('tag-list', 'GET /api/tags/',
+                 lambda: anonymous.get('/api/tags/')),
+            Case('tag-detail', 'GET /api/tags/{id}/',
+                 lambda: anonymous.get(f'/api/tags/{self.tag.id}/')),
+            Case('ingredient-list', 'GET /api/ingredients/?name=',
+                 lambda: anonymous.get('/api/ingredients/?name=ка')),
+            Case('ingredient-detail', 'GET /api/ingredients/{id}/',
+                 lambda: anonymous.get(
+                     f'/api/ingredients/{self.ingredient.id}/')),
+            Case('user-list', 'GET /api/users/',
+                 lambda: user.get('/api/users/')),
+            Case('user-list', 'POST /api/users/',
+                 lambda: anonymous.post('/api/users/', json.dumps({
+                     'email': 'new-cook@example.com',
+                     'username': 'new-cook', 'first_name': 'Имя',
+                     'last_name': 'Фамилия', 'password': PASSWORD,
+                 }), **as_json)),
+            Case('user-detail', 'GET /api/users/{id}/',
+                 lambda: user.get(f'/api/users/{author}/')),
+            Case('user-me', 'GET /api/users/me/',
+                 lambda: user.get('/api/users/me/')),
+            Case('user-set-password', 'POST /api/users/set_password/',
+                 lambda: user.post('/api/users/set_password/', json.dumps({
+                     'current_password': PASSWORD,
+                     'new_password': f'{PASSWORD}-new',
+                 }), **as_json)),
+            Case('subscription-subscriptions',
+                 'GET /api/users/subscriptions/',
+                 lambda: user.get('/api/users/subscriptions/')),
+            Case('subscription-subscribe',
+                 'POST /api/users/{id}/subscribe/',
+                 lambda: user.post(f'/api/users/{author}/subscribe/')),
+            Case('subscription-subscribe-batch',
+                 'POST /api/users/subscribe/',
+                 lambda: user.post('/api/users/subscribe/', author_ids,
+                                   **as_json)),
+            Case('login', 'POST /api/auth/token/login/',
+                 lambda: anonymous.post('/api/auth/token/login/', {
+                     'email': self.user.email, 'password': PASSWORD})),
+            Case('logout', 'POST /api/auth/token/logout/',
+                 lambda: admin.post('/api/auth/token/logout/')),
+            Case('metrics/', 'GET /api/metrics/',
+                 lambda: admin.get('/api/metrics/')),
+            Case('reference-cache/stats/',
+                 'GET /api/reference-cache/stats/',
+                 lambda: admin.get('/api/reference-cache/stats/')),
+        ]
+
+    @staticmethod
+    def measure(case, repeat):
+        """Run the case `repeat` times after a warm-up run, each time in
+        a savepoint that is rolled back."""
+        timings, queries = [], []
+        for number in range(repeat + 1):
+            metrics = RequestMetrics()
+            try:
+                with transaction.atomic():
+                    if case.setup is not None:
+                        case.setup()
+                    with contextlib.ExitStack() as stack:
+                        for connection in connections.all():
+                            stack.enter_context(connection.execute_wrapper(
+                                metrics.execute_wrapper))
+                        started = time.perf_counter()
+                        response = case.request()
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+            except Exception as error:
+                return {'error': repr(error)}
+            if number:
+                timings.append(elapsed * 1000)
+                queries.append(metrics.queries)
+        return {
+            'status': response.status_code,
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+        }
+
+    def report(self, label, result, previous, threshold):
+        if 'error' in result:
+            self.stdout.write(self.style.ERROR(f'{label}: {result["error"]}'))
+            return
+        line = (f'{label:<48} {result["status"]:>3} '
+                f'{result["median_ms"]:8.2f} мс '
+                f'(макс. {result["max_ms"]:8.2f}) '
+                f'{result["queries"]:>3} запр.')
+        if not previous or 'error' in previous:
+            self.stdout.write(line)
+            return
+        change = result['median_ms'] / max(previous['median_ms'], 1e-6) - 1
+        more_queries = result['queries'] - previous['queries']
+        line += f'  {change:+.0%}, запросов {more_queries:+d}'
+        if change > threshold or more_queries > 0:
+            self.stdout.write(self.style.ERROR(line))
+        else:
+            self.stdout.write(line)
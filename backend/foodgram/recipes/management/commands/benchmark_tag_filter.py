@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = ('Compare join+DISTINCT and EXISTS tag filtering of the recipe '
+            'list on growing synthetic data. Changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+            help='Количество рецептов на каждом шаге.')
+        parser.add_argument(
+            '--tags', type=int, default=2,
+            help='Количество тегов в фильтре.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        tags = list(Tag.objects.order_by('id')[:options['tags']])
+        if len(tags) < options['tags']:
+            raise CommandError(
+                f'Нужно хотя бы {options["tags"]} тега в базе.')
+        with transaction.atomic():
+            author = User.objects.create(
+                username='benchmark-tag-filter',
+                email='benchmark-tag-filter@example.com')
+            created = 0
+            for size in sorted(options['sizes']):
+                self.populate(author, created, size)
+                created = size
+                self.report(size, tags, options['repeat'])
+            transaction.set_rollback(True)
+
+    def populate(self, author, start, stop):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(author=author, name=f'benchmark {number}', text='-',
+                    image='recipes/benchmark.png', cooking_time=1)
+             for number in range(start, stop)))
+        recipe_ids = Recipe.objects.filter(author=author).order_by(
+            'id').values_list('id', flat=True)[start:stop]
+        Through = Recipe.tags.through
+        Through.objects.bulk_create(
+            (Through(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids.iterator()
+             for tag_id in random.sample(
+                 tag_ids, random.randint(1, min(3, len(tag_ids))))))
+
+    def report(self, size, tags, repeat):
+        slugs = [tag.slug for tag in tags]
+        joined = self.measure(repeat, lambda: list(
+            Recipe.objects.filter(tags__slug__in=slugs).distinct()
+            [:PAGE_SIZE]))
+        exists = self.measure(repeat, lambda: list(
+            Recipe.objects.with_any_tag(tags)[:PAGE_SIZE]))
+        self.stdout.write(
+            f'{size:>8} рецептов: JOIN+DISTINCT {joined:8.2f} мс, '
+            f'EXISTS {exists:8.2f} мс')
+
+    @staticmethod
+    def measure(repeat, query):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,294 @@
+import hashlib
+import itertools
+import random
+import time
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from PIL import Image
+
+from recipes.counters import recount_recipes, recount_users
+from recipes.images import generate_variants
+from recipes.loaders import iter_json_array, load_rows
+from recipes.management.commands.load_ingredients import DEFAULT_PATH
+from recipes.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem,
+                            TableVersion, Tag)
+from recipes.search import update_search_index
+from users.models import Subscription, User
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5A623', 'dessert'),
+    ('Выпечка', '#C28A4E', 'bakery'),
+    ('Суп', '#D0021B', 'soup'),
+    ('Салат', '#7ED321', 'salad'),
+    ('Напиток', '#4A90E2', 'drink'),
+)
+DISHES = ('Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Омлет', 'Паста',
+          'Каша', 'Смузи', 'Котлеты', 'Плов', 'Блины', 'Соус', 'Жаркое')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей', 'Юлия', 'Михаил')
+LAST_NAMES = ('Иванова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова',
+              'Лебедев', 'Козлова', 'Новиков', 'Морозова', 'Волков')
+PASSWORD = 'foodgram-synthetic'
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Popularity:
+    """Weighted choice of objects with a long tail: the object of rank
+    `n` is picked `n` times less often than the most popular one."""
+
+    def __init__(self, rng, ids):
+        self.rng = rng
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(self.ids) + 1)))
+
+    def choices(self, count):
+        return self.rng.choices(self.ids, cum_weights=self.weights, k=count)
+
+    def sample(self, count, exclude=None):
+        """Return up to `count` distinct IDs other than `exclude`."""
+        count = min(count, len(self.ids) - (exclude is not None))
+        if count > len(self.ids) // 2:
+            # The long tail would take too many draws, pick uniformly.
+            chosen = set(self.rng.sample(
+                self.ids, min(count + 1, len(self.ids))))
+            chosen.discard(exclude)
+            return set(itertools.islice(chosen, count))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.choices(count - len(chosen)))
+            chosen.discard(exclude)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic users, recipes, favorites, shopping carts '
+            'and subscriptions with bulk inserts, e.g. to benchmark on '
+            'realistic volumes of data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Среднее число рецептов в избранном у пользователя.')
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в списке покупок у пользователя.')
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Среднее число подписок у пользователя.')
+        parser.add_argument(
+            '--ingredients-path', default=DEFAULT_PATH,
+            help='Файл ингредиентов на случай, если в базе их нет.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        if self.using not in connections:
+            raise CommandError(f'Неизвестная база данных: {self.using}')
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        started = time.monotonic()
+
+        ingredients = self.ensure_ingredients(options['ingredients_path'])
+        tag_ids = self.ensure_tags()
+        image = self.create_image()
+        user_ids = self.create_users(options['users'])
+        authors = Popularity(self.rng, user_ids)
+        recipe_ids = self.create_recipes(
+            options['recipes'], authors, ingredients, tag_ids, image)
+        self.create_links(Subscription, 'author', user_ids, authors,
+                          options['subscriptions'], exclude_self=True)
+        if recipe_ids:
+            recipes = Popularity(self.rng, recipe_ids)
+            self.create_links(Favorite, 'recipe', user_ids, recipes,
+                              options['favorites'])
+            self.create_links(ShoppingCart, 'recipe', user_ids, recipes,
+                              options['carts'])
+        self.update_aggregates(user_ids, recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}'))
+
+    def stage(self, title, count, started):
+        seconds = time.monotonic() - started
+        self.stdout.write(
+            f'{title}: {count} за {seconds:.2f} с '
+            f'({count / max(seconds, 1e-6):.0f} строк/с)')
+
+    def insert(self, model, objs):
+        """Insert `objs` and return their primary keys, also on databases
+        that do not return them from bulk inserts."""
+        manager = model.objects.db_manager(self.using)
+        features = connections[self.using].features
+        with transaction.atomic(using=self.using):
+            if features.can_return_ids_from_bulk_insert:
+                manager.bulk_create(objs)
+                return [obj.pk for obj in objs]
+            last = manager.order_by('-pk').values_list(
+                'pk', flat=True).first() or 0
+            manager.bulk_create(objs)
+            return list(manager.filter(pk__gt=last).order_by(
+                'pk').values_list('pk', flat=True))
+
+    def insert_rows(self, model, fields, rows):
+        """Insert tuples of `fields` values with multi-row INSERT
+        statements, without building model instances."""
+        connection = connections[self.using]
+        quote = connection.ops.quote_name
+        columns = [model._meta.get_field(field).column for field in fields]
+        sql = 'INSERT INTO {} ({}) VALUES '.format(
+            quote(model._meta.db_table), ', '.join(map(quote, columns)))
+        values = '({})'.format(', '.join(['%s'] * len(fields)))
+        size = min(self.batch_size,
+                   connection.ops.bulk_batch_size(columns, rows) or 1)
+        with transaction.atomic(using=self.using), \
+                connection.cursor() as cursor:
+            for batch in chunks(rows, size):
+                cursor.execute(
+                    sql + ', '.join([values] * len(batch)),
+                    [value for row in batch for value in row])
+
+    def ensure_ingredients(self, path):
+        ingredients = Ingredient.objects.using(self.using)
+        if not ingredients.exists():
+            try:
+                with open(path, encoding='utf-8') as file:
+                    load_rows(Ingredient, iter_json_array(file),
+                              self.batch_size, using=self.using)
+            except (OSError, ValueError) as error:
+                raise CommandError(error)
+        return list(ingredients.values_list('id', 'measurement_unit'))
+
+    def ensure_tags(self):
+        tags = Tag.objects.db_manager(self.using)
+        if not tags.filter(slug__in=[slug for _, _, slug in TAGS]).exists():
+            tags.bulk_create(
+                [Tag(name=name, color=color, slug=slug)
+                 for name, color, slug in TAGS],
+                ignore_conflicts=True)
+            TableVersion.objects.db_manager(self.using).bump(Tag)
+        return list(tags.values_list('id', flat=True))
+
+    def create_image(self):
+        """Store one picture shared by all generated recipes."""
+        content = BytesIO()
+        Image.new('RGB', (1200, 800), (226, 108, 45)).save(content, 'JPEG')
+        content = content.getvalue()
+        storage = Recipe._meta.get_field('image').storage
+        name = storage.save(
+            f'recipes/{hashlib.sha256(content).hexdigest()}.jpg',
+            ContentFile(content))
+        generate_variants(storage, name)
+        return name
+
+    def create_users(self, count):
+        started = time.monotonic()
+        prefix = f'synthetic-{self.rng.getrandbits(32):08x}'
+        password = make_password(PASSWORD)
+        user_ids = []
+        for numbers in chunks(range(count), self.batch_size):
+            user_ids += self.insert(User, [
+                User(username=f'{prefix}-{number}',
+                     email=f'{prefix}-{number}@example.com',
+                     first_name=self.rng.choice(FIRST_NAMES),
+                     last_name=self.rng.choice(LAST_NAMES),
+                     password=password)
+                for number in numbers])
+        self.stage('Пользователи', count, started)
+        return user_ids
+
+    def create_recipes(self, count, authors, ingredients, tag_ids, image):
+        started = time.monotonic()
+        recipe_ids = []
+        for numbers in chunks(range(count), self.batch_size):
+            recipes, rows = [], []
+            for number in numbers:
+                chosen = self.rng.sample(
+                    ingredients, min(self.rng.randint(5, 30),
+                                     len(ingredients)))
+                rows.append(chosen)
+                cooking_time = self.rng.randint(5, 180)
+                recipes.append(Recipe(
+                    author_id=authors.choices(1)[0],
+                    name=f'{self.rng.choice(DISHES)} №{number + 1}',
+                    text=f'Смешайте {len(chosen)} ингредиентов и готовьте '
+                         f'{cooking_time} минут.',
+                    image=image,
+                    image_variants_ready=True,
+                    cooking_time=cooking_time))
+            ids = self.insert(Recipe, recipes)
+            recipe_ids += ids
+            self.insert_rows(Recipe.tags.through, ('recipe', 'tag'), [
+                (recipe_id, tag_id)
+                for recipe_id in ids
+                for tag_id in self.rng.sample(
+                    tag_ids, self.rng.randint(1, min(3, len(tag_ids))))])
+            self.insert_rows(
+                IngredientRecipe, ('recipe', 'ingredient', 'amount'), [
+                    (recipe_id, ingredient_id, self.amount(unit))
+                    for recipe_id, chosen in zip(ids, rows)
+                    for ingredient_id, unit in chosen])
+        self.stage('Рецепты', count, started)
+        return recipe_ids
+
+    def amount(self, unit):
+        if unit in ('г', 'мл'):
+            return self.rng.randrange(10, 1001, 10)
+        if unit == 'по вкусу':
+            return 1
+        return self.rng.randint(1, 5)
+
+    def create_links(self, model, field, user_ids, targets, average,
+                     exclude_self=False):
+        """Link every user to a random number of popular `targets`, on
+        average `average` of them."""
+        started = time.monotonic()
+        created = 0
+        for users in chunks(user_ids, max(self.batch_size // (
+                average or 1), 1)):
+            rows = [
+                (user_id, target_id)
+                for user_id in users
+                for target_id in targets.sample(
+                    self.rng.randint(0, 2 * average),
+                    exclude=user_id if exclude_self else None)]
+            self.insert_rows(model, ('user', field), rows)
+            created += len(rows)
+        self.stage(model._meta.verbose_name_plural.capitalize(), created,
+                   started)
+
+    def update_aggregates(self, user_ids, recipe_ids):
+        """Fill counters, shopping lists, feed timelines and the search
+        index of the generated rows."""
+        started = time.monotonic()
+        for ids in chunks(recipe_ids, self.batch_size):
+            recount_recipes(ids, using=self.using)
+            update_search_index(ids, using=self.using)
+        feeds = FeedEntry.objects.db_manager(self.using)
+        for ids in chunks(user_ids, self.batch_size):
+            recount_users(ids, using=self.using)
+            ShoppingListItem.objects.db_manager(self.using).rebuild(ids)
+            feeds.update_fanout(ids)
+        for ids in chunks(user_ids, self.batch_size):
+            feeds.rebuild(ids)
+        self.stage('Счётчики, списки покупок и ленты',
+                   len(user_ids) + len(recipe_ids), started)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, mark_variants_ready
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generate missing resized variants of recipe images.'
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True).distinct()
+        storage = Recipe._meta.get_field('image').storage
+        failed = 0
+        for name in names.iterator():
+            try:
+                generate_variants(storage, name)
+                mark_variants_ready(name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью созданы, ошибок: {failed}.'))
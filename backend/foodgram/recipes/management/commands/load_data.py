@@ -0,0 +1,65 @@
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.loaders import (REFERENCE_MODELS, iter_csv, iter_json_array,
+                             load_rows)
+
+
+class Command(BaseCommand):
+    help = ('Load rows from a JSON array, a Django fixture or a CSV file '
+            'into a reference model (' + ', '.join(REFERENCE_MODELS) + ') '
+            'with batched inserts, skipping rows that already exist. '
+            'Fixture objects of other models are skipped, load them with '
+            'loaddata.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Модель, например recipes.Tag.')
+        parser.add_argument('path', help='Путь к файлу .json или .csv.')
+        parser.add_argument(
+            '--format', choices=('json', 'csv'),
+            help='Формат файла, по умолчанию по расширению.')
+        parser.add_argument(
+            '--fields',
+            help='Имена колонок через запятую для CSV без заголовка.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as error:
+            raise CommandError(error)
+        if model._meta.label not in REFERENCE_MODELS:
+            raise CommandError(
+                f'Загрузка поддерживается только для моделей '
+                f'{", ".join(REFERENCE_MODELS)}, используйте loaddata.')
+        self.load(model, options['path'], options)
+
+    def load(self, model, path, options):
+        file_format = options.get('format') or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        fields = options.get('fields')
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                if file_format == 'json':
+                    rows = iter_json_array(file)
+                else:
+                    rows = iter_csv(file, fields.split(',') if fields
+                                    else None)
+                read, inserted, seconds = load_rows(
+                    model, rows, options['batch_size'], self.progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.label}: прочитано {read}, добавлено {inserted}, '
+            f'пропущено {read - inserted} за {seconds:.2f} с '
+            f'({read / max(seconds, 1e-6):.0f} строк/с).'))
+
+    def progress(self, read, seconds):
+        self.stdout.write(
+            f'Загружено {read} строк ({read / max(seconds, 1e-6):.0f} '
+            f'строк/с)', ending='\r')
+        self.stdout.flush()
@@ -0,0 +1,26 @@
+import os
+
+from django.conf import settings
+
+from recipes.management.commands.load_data import Command as LoadDataCommand
+from recipes.models import Ingredient
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(settings.BASE_DIR)),
+    'data', 'ingredients.json')
+
+
+class Command(LoadDataCommand):
+    help = ('Load ingredients from data/ingredients.json (or another JSON '
+            'or CSV file) with batched inserts, skipping existing ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=('json', 'csv'))
+        parser.add_argument(
+            '--fields',
+            help='Имена колонок через запятую для CSV без заголовка.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.load(Ingredient, options['path'], options)
@@ -0,0 +1,115 @@
+import http.client
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Load running servers with concurrent GET requests and compare '
+            'throughput and latency, e.g. WSGI and ASGI deployments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='Сервер в виде имя=http://host:port, можно несколько.')
+        parser.add_argument(
+            '--path', action='append',
+            help='Путь запроса, можно несколько. По умолчанию '
+                 '/api/recipes/ и /api/tags/.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Сколько клиентов медленно отправляют тело запроса '
+                 'во время теста.')
+        parser.add_argument(
+            '--token', help='Токен для заголовка Authorization.')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or ['/api/recipes/', '/api/tags/']
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            url = urlsplit(url)
+            if not url.hostname:
+                raise CommandError(f'Неверный адрес сервера: {target}')
+            result = self.run(url, paths, headers, options)
+            self.report(name, result, options['duration'])
+
+    def run(self, url, paths, headers, options):
+        stop = time.monotonic() + options['duration']
+        latencies, errors = [], []
+        threads = [
+            threading.Thread(target=self.client, args=(
+                url, paths, headers, stop, latencies, errors))
+            for _ in range(options['concurrency'])]
+        threads += [
+            threading.Thread(target=self.slow_client, args=(url, stop))
+            for _ in range(options['slow_clients'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors
+
+    @staticmethod
+    def client(url, paths, headers, stop, latencies, errors):
+        connection = http.client.HTTPConnection(
+            url.hostname, url.port, timeout=30)
+        number = 0
+        while time.monotonic() < stop:
+            path = paths[number % len(paths)]
+            number += 1
+            started = time.monotonic()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as error:
+                errors.append(error)
+                connection.close()
+                continue
+            if response.status >= 500:
+                errors.append(response.status)
+            else:
+                latencies.append(time.monotonic() - started)
+        connection.close()
+
+    @staticmethod
+    def slow_client(url, stop):
+        """Send a large body one byte at a time, like a slow upload."""
+        try:
+            with socket.create_connection(
+                    (url.hostname, url.port), timeout=5) as sock:
+                sock.sendall(
+                    b'POST /api/recipes/ HTTP/1.1\r\n'
+                    + f'Host: {url.hostname}\r\n'.encode()
+                    + b'Content-Type: application/json\r\n'
+                    b'Content-Length: 1000000\r\n\r\n')
+                while time.monotonic() < stop:
+                    sock.sendall(b' ')
+                    time.sleep(0.5)
+        except OSError:
+            pass
+
+    def report(self, name, result, duration):
+        latencies, errors = result
+        latencies.sort()
+        count = len(latencies)
+        if not count:
+            self.stdout.write(f'{name}: нет успешных ответов, '
+                              f'ошибок {len(errors)}.')
+            return
+
+        def percentile(value):
+            return latencies[int(value * (count - 1))] * 1000
+
+        self.stdout.write(
+            f'{name}: {count / duration:.1f} запросов/с, '
+            f'p50 {percentile(0.5):.1f} мс, p99 {percentile(0.99):.1f} мс, '
+            f'ошибок {len(errors)}')
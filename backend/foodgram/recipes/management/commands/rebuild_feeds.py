@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = ('Switch authors between copying recipes into timelines and '
+            'reading them at feed time by the current limits, then '
+            'rebuild all subscription feed timelines.')
+
+    def handle(self, *args, **options):
+        switched_on = FeedEntry.objects.update_fanout()
+        FeedEntry.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны, авторов снова в рассылке: '
+            f'{len(switched_on)}.'))
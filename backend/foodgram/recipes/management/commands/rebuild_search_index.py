@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of recipe names and texts.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        update_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            'Поисковый индекс рецептов пересобран.'))
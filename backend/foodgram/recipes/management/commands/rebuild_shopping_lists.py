@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Verify per-user shopping list totals against shopping carts '
+            'and rebuild the ones that drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report users with wrong totals, do not fix them.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild totals of all users without verifying them.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок пересобраны.'))
+            return
+
+        expected = self.group(ShoppingListItem.objects.expected())
+        stored = self.group(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'))
+        drifted = sorted(
+            user_id for user_id in expected.keys() | stored.keys()
+            if expected.get(user_id) != stored.get(user_id))
+
+        self.stdout.write(
+            f'Пользователей со списком покупок: {len(expected)}, '
+            f'с расхождениями: {len(drifted)}.')
+        if not drifted or options['check']:
+            return
+        ShoppingListItem.objects.rebuild(drifted)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено списков: {len(drifted)}.'))
+
+    @staticmethod
+    def group(rows):
+        totals = defaultdict(dict)
+        for user_id, ingredient_id, amount in rows.iterator():
+            totals[user_id][ingredient_id] = amount
+        return totals
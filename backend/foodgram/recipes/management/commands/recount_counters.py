@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_recipes, recount_users
+
+
+class Command(BaseCommand):
+    help = ('Recompute stored favorites, cart, recipes and followers '
+            'counters and fix the ones that drifted.')
+
+    def handle(self, *args, **options):
+        recipes = recount_recipes()
+        users = recount_users()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: рецептов {recipes}, '
+            f'пользователей {users}.'))
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    User.objects.filter(
+        models.Q(followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        | models.Q(recipes_count__gt=settings.FEED_FANOUT_MAX_RECIPES)
+    ).update(feed_fanout=False)
+    rows = Recipe.objects.filter(
+        author__feed_fanout=True,
+        author__following__isnull=False).values_list(
+            'author__following__user', 'id', 'author_id', 'created')
+    batch = []
+    for user_id, recipe_id, author_id, created in rows.iterator():
+        batch.append(FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                               author_id=author_id, created=created))
+        if len(batch) >= 1000:
+            FeedEntry.objects.bulk_create(batch)
+            batch = []
+    FeedEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0020_recipe_updated_tableversion'),
+        ('users', '0003_user_feed_fanout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='Дата создания рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'запись ленты',
+                'verbose_name_plural': 'записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-created', '-recipe'], name='feed_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_feed_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
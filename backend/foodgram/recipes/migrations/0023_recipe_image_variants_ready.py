@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:05
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_ready(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = Recipe.objects.exclude(image='').values_list(
+        'image', flat=True).distinct()
+    ready = []
+    for name in names.iterator():
+        stem = os.path.splitext(os.path.basename(name))[0]
+        if all(storage.exists(f'recipes/variants/{stem}_{variant}.webp')
+               for variant in settings.RECIPE_IMAGE_VARIANTS):
+            ready.append(name)
+    for start in range(0, len(ready), 500):
+        Recipe.objects.filter(image__in=ready[start:start + 500]).update(
+            image_variants_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью картинки созданы'),
+        ),
+        migrations.RunPython(mark_ready, migrations.RunPython.noop),
+    ]
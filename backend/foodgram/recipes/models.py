@@ -1,7 +1,16 @@
+import heapq
+
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Q, Sum,
+                              Value, When, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
-from users.models import User
+from recipes import search
+from recipes.storage import DeduplicatingStorage
+from users.models import CounterFieldsMixin, Subscription, User
 
 
 class Tag(models.Model):
@@ -59,7 +68,87 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet with helpers to load recipes for serialization."""
+
+    @staticmethod
+    def related_lookups():
+        """Prefetch lookups of tags and ingredient rows with their
+        ingredients."""
+        return ('tags', Prefetch(
+            'recipe_ingredients',
+            queryset=IngredientRecipe.objects.select_related('ingredient')))
+
+    def with_related(self):
+        """Join author and prefetch tags and ingredient rows."""
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups())
+
+    def with_user_flags(self, user):
+        """Annotate `is_favorited`, `is_in_shopping_cart` and
+        `author_is_subscribed` for the given user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, models.BooleanField()),
+                is_in_shopping_cart=Value(False, models.BooleanField()),
+                author_is_subscribed=Value(False, models.BooleanField()))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))))
+
+    def touch(self):
+        """Mark recipes as changed, refreshing cached representations."""
+        return self.update(updated=timezone.now())
+
+    def _filter_exists(self, name, subquery):
+        # Django 2.2 can filter on Exists() only through an annotation.
+        return self.annotate(**{name: Exists(subquery)}).filter(
+            **{name: True})
+
+    def with_any_tag(self, tags):
+        """Recipes having at least one of `tags`, without duplicates."""
+        return self._filter_exists(
+            'has_tag', Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=tags))
+
+    def favorited_by(self, user):
+        if not user.is_authenticated:
+            return self.none()
+        return self._filter_exists(
+            'favorited_by_user', Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+
+    def in_cart_of(self, user):
+        if not user.is_authenticated:
+            return self.none()
+        return self._filter_exists(
+            'in_cart_of_user', ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+
+    def search(self, query):
+        """Full-text search by name and text, best matches first."""
+        return search.search(self, query)
+
+    def latest_per_author(self, author_ids, limit):
+        """Return at most `limit` latest recipes of each author with one
+        ROW_NUMBER() window query."""
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('created').desc(), F('id').desc()]))
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            f'ORDER BY recipe_rank',
+            params + (limit,))
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Recipe model"""
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -74,6 +163,7 @@ class Recipe(models.Model):
 
     image = models.ImageField(
         upload_to='recipes/',
+        storage=DeduplicatingStorage(),
         verbose_name='Картинка'
     )
 
@@ -108,8 +198,43 @@ class Recipe(models.Model):
         verbose_name='Дата создания'
     )
 
+    updated = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата изменения'
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество в избранном'
+    )
+
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество в списках покупок'
+    )
+
+    image_variants_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Превью картинки созданы'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count', 'carts_count')
+
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['-favorites_count', '-created'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-created', '-id'],
+                         name='recipe_created_idx'),
+            models.Index(fields=['author', '-created'],
+                         name='recipe_author_created_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'name'],
@@ -121,6 +246,11 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Not auto_now, so that fixtures without the field still load.
+        self.updated = timezone.now()
+        super().save(*args, **kwargs)
+
 
 class Favorite(models.Model):
     """Model for users favorites recipes."""
@@ -195,3 +325,336 @@ class IngredientRecipe(models.Model):
 
     def __str__(self):
         return f'{self.ingredient}: {self.amount}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """Keeps per-user ingredient totals in sync with shopping carts."""
+
+    def add_recipes(self, user, recipe_ids):
+        """Add ingredients of recipes just put into the user's cart."""
+        self._apply(user, recipe_ids, 1)
+
+    def remove_recipes(self, user, recipe_ids):
+        """Subtract ingredients of recipes just removed from the cart."""
+        self._apply(user, recipe_ids, -1)
+
+    @transaction.atomic
+    def _apply(self, user, recipe_ids, sign):
+        amounts = dict(IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'ingredient_id').annotate(Sum('amount')).order_by())
+        if not amounts:
+            return
+        items = self.filter(user=user, ingredient_id__in=amounts)
+        if sign > 0:
+            self.bulk_create(
+                [self.model(user=user, ingredient_id=ingredient_id,
+                            total_amount=0) for ingredient_id in amounts],
+                ignore_conflicts=True)
+        items.update(total_amount=F('total_amount') + Case(
+            *[When(ingredient_id=ingredient_id, then=Value(sign * amount))
+              for ingredient_id, amount in amounts.items()],
+            output_field=models.IntegerField()))
+        if sign < 0:
+            items.filter(total_amount__lte=0).delete()
+
+    def expected(self, user_ids=None):
+        """Totals computed from carts, as (user_id, ingredient_id,
+        total_amount) rows."""
+        lookups = {'recipe__cart__isnull': False}
+        if user_ids is not None:
+            lookups['recipe__cart__user_id__in'] = user_ids
+        return IngredientRecipe.objects.using(self._db).filter(
+            **lookups).values_list(
+                'recipe__cart__user', 'ingredient').annotate(
+                    Sum('amount')).order_by()
+
+    def rebuild(self, user_ids=None):
+        """Recompute totals of the given users (all users by default)."""
+        items = self.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            items = items.filter(user_id__in=user_ids)
+        with transaction.atomic(using=self._db):
+            items.delete()
+            objs = [self.model(user_id=user_id, ingredient_id=ingredient_id,
+                               total_amount=total_amount)
+                    for user_id, ingredient_id, total_amount
+                    in self.expected(user_ids).iterator()]
+            # SQLite limits the number of rows in one insert.
+            batch_size = min(1000, connections[self.db].ops.bulk_batch_size(
+                self.model._meta.concrete_fields, objs) or 1)
+            self.bulk_create(objs, batch_size=batch_size)
+
+    @transaction.atomic
+    def change_recipe(self, recipe_id, deltas):
+        """Apply changes of ingredient amounts of a recipe, {ingredient_id:
+        delta}, to the totals of all users who have it in the cart."""
+        if not deltas:
+            return
+        increased = [ingredient_id for ingredient_id, delta in deltas.items()
+                     if delta > 0]
+        if increased:
+            rows = IngredientRecipe.objects.using(self.db).filter(
+                recipe_id=recipe_id, ingredient_id__in=increased,
+                recipe__cart__isnull=False).annotate(
+                    zero=Value(0, output_field=models.IntegerField()))
+            self._insert_missing(rows.values_list(
+                'recipe__cart__user_id', 'ingredient_id', 'zero'))
+        items = self.filter(
+            user_id__in=ShoppingCart.objects.using(self.db).filter(
+                recipe_id=recipe_id).values('user_id'),
+            ingredient_id__in=deltas)
+        items.update(total_amount=F('total_amount') + Case(
+            *[When(ingredient_id=ingredient_id, then=Value(delta))
+              for ingredient_id, delta in deltas.items()],
+            output_field=models.IntegerField()))
+        if len(increased) < len(deltas):
+            items.filter(total_amount__lte=0).delete()
+
+    def _insert_missing(self, rows):
+        """Insert (user_id, ingredient_id, total_amount) `rows` of a query
+        with one INSERT ... SELECT skipping existing items."""
+        connection = connections[self.db]
+        ops = connection.ops
+        select, params = rows.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '{} {} (user_id, ingredient_id, total_amount) {} {}'.format(
+                    ops.insert_statement(ignore_conflicts=True),
+                    ops.quote_name(self.model._meta.db_table), select,
+                    ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)),
+                params)
+
+
+class ShoppingListItem(models.Model):
+    """Total amount of an ingredient over all recipes in the user's
+    shopping cart."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.total_amount}'
+
+
+class FeedEntryManager(models.Manager):
+    """Keeps timelines of subscribers in sync with recipes and
+    subscriptions.
+
+    Recipes are copied into timelines only for authors with
+    `feed_fanout` on. An author is switched off for good once they have
+    more than `FEED_FANOUT_MAX_FOLLOWERS` followers or
+    `FEED_FANOUT_MAX_RECIPES` recipes, and `recipe_ids` merges their
+    recipes in at read time. `rebuild_feeds` recomputes the switch.
+    """
+
+    def fan_out(self, recipe):
+        """Add a just created recipe to timelines of the followers of its
+        author."""
+        if not self._check_fanout([recipe.author_id]):
+            return
+        self.bulk_create(
+            [self.model(user_id=user_id, recipe_id=recipe.id,
+                        author_id=recipe.author_id, created=recipe.created)
+             for user_id in Subscription.objects.filter(
+                 author_id=recipe.author_id).values_list(
+                     'user_id', flat=True).iterator()])
+
+    def follow(self, user, author_ids):
+        """Copy recipes of just followed authors into the user's
+        timeline."""
+        author_ids = self._check_fanout(author_ids)
+        self._fill(Q(author__following__user=user,
+                     author_id__in=author_ids))
+
+    def unfollow(self, user, author_ids):
+        """Remove recipes of just unfollowed authors from the user's
+        timeline."""
+        self.filter(user=user, author_id__in=author_ids).delete()
+
+    def rebuild(self, user_ids=None):
+        """Recompute timelines of the given users (all users by
+        default)."""
+        entries = self.all()
+        condition = Q(author__feed_fanout=True)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            entries = entries.filter(user_id__in=user_ids)
+            condition &= Q(author__following__user_id__in=user_ids)
+        with transaction.atomic(using=self._db):
+            entries.delete()
+            self._fill(condition)
+
+    def update_fanout(self, author_ids=None):
+        """Recompute `feed_fanout` of authors from current limits, return
+        IDs of authors whose recipes have to be added to timelines."""
+        authors = User.objects.using(self._db)
+        if author_ids is not None:
+            authors = authors.filter(pk__in=author_ids)
+        within = (Q(followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+                  & Q(recipes_count__lte=settings.FEED_FANOUT_MAX_RECIPES))
+        switched_on = list(authors.filter(
+            within, feed_fanout=False).values_list('pk', flat=True))
+        authors.filter(pk__in=switched_on).update(feed_fanout=True)
+        self._switch_off(authors.filter(~within, feed_fanout=True))
+        return switched_on
+
+    def recipe_ids(self, user, position=None, limit=10):
+        """Return IDs of up to `limit` recipes of the user's feed in
+        ('-created', '-id') order, after `position` if it is given."""
+        entries = self.filter(user=user)
+        pulled = Recipe.objects.using(self._db).filter(
+            author__following__user=user, author__feed_fanout=False)
+        if position is not None:
+            created, pk = position
+            entries = entries.filter(
+                Q(created__lt=created) | Q(created=created, recipe_id__lt=pk))
+            pulled = pulled.filter(
+                Q(created__lt=created) | Q(created=created, id__lt=pk))
+        pushed = entries.order_by('-created', '-recipe_id').values_list(
+            'created', 'recipe_id')[:limit]
+        pulled = pulled.order_by('-created', '-id').values_list(
+            'created', 'id')[:limit]
+        merged = heapq.merge(list(pushed), list(pulled), reverse=True)
+        return list(dict.fromkeys(pk for _, pk in merged))[:limit]
+
+    def _check_fanout(self, author_ids):
+        """Switch off authors over the limits, return the IDs of the
+        others with `feed_fanout` on."""
+        authors = User.objects.using(self._db).filter(
+            pk__in=author_ids, feed_fanout=True)
+        self._switch_off(authors.filter(
+            Q(followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            | Q(recipes_count__gt=settings.FEED_FANOUT_MAX_RECIPES)))
+        return list(authors.values_list('pk', flat=True))
+
+    def _switch_off(self, authors):
+        author_ids = list(authors.values_list('pk', flat=True))
+        if author_ids:
+            User.objects.using(self._db).filter(pk__in=author_ids).update(
+                feed_fanout=False)
+            self.filter(author_id__in=author_ids).delete()
+
+    def _fill(self, condition):
+        """Add an entry for every (follower, recipe) pair matching
+        `condition` on recipes."""
+        rows = Recipe.objects.using(self._db).filter(condition).values_list(
+            'author__following__user', 'id', 'author_id', 'created')
+        batch = []
+        for user_id, recipe_id, author_id, created in rows.iterator():
+            if user_id is None:
+                continue
+            batch.append(self.model(user_id=user_id, recipe_id=recipe_id,
+                                    author_id=author_id, created=created))
+            if len(batch) >= 1000:
+                self.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        self.bulk_create(batch, ignore_conflicts=True)
+
+
+class FeedEntry(models.Model):
+    """Recipe in the feed timeline of a subscriber of its author."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата создания рецепта'
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи лент'
+        indexes = [
+            models.Index(fields=['user', '-created', '-recipe'],
+                         name='feed_user_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_feed_recipe')
+        ]
+
+
+class TableVersionManager(models.Manager):
+
+    def bump(self, model):
+        """Mark the table of `model` as changed."""
+        label = model._meta.label_lower
+        changed = self.filter(table=label).update(
+            version=F('version') + 1, updated=timezone.now())
+        if not changed:
+            self.get_or_create(table=label)
+
+    def get_all(self):
+        """Return version rows keyed by table label. Tables that never
+        changed have no row."""
+        return {version.table: version for version in self.all()}
+
+
+class TableVersion(models.Model):
+    """Change counter of a whole table, used to validate cached
+    responses built from it."""
+    table = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Таблица'
+    )
+    version = models.BigIntegerField(
+        default=1,
+        verbose_name='Версия'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        null=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = TableVersionManager()
+
+    class Meta:
+        verbose_name = 'версия таблицы'
+        verbose_name_plural = 'версии таблиц'
+
+    def __str__(self):
+        return f'{self.table}: {self.version}'
@@ -0,0 +1,140 @@
+"""Ranked full-text search of recipes by name and text.
+
+PostgreSQL keeps a `search_vector` column of `recipes_recipe` (name with
+weight A, text with weight B, Russian configuration) under a GIN index.
+SQLite keeps a copy of names and texts in the FTS5 table
+`recipes_recipe_search`. Both are created by a migration outside of the
+model state and refreshed by `update_search_index` when recipes are
+saved; `rebuild_search_index` refills them. Other databases fall back to
+unranked substring search.
+"""
+import html
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_search'
+BATCH_SIZE = 500
+TSQUERY = "websearch_to_tsquery('russian', %s)"
+# Control characters can not come from HTML, so they are safe to turn
+# into <mark> after the rest of the headline is escaped.
+START, STOP = '\x02', '\x03'
+NAME_HEADLINE = f'StartSel={START}, StopSel={STOP}, HighlightAll=true'
+TEXT_HEADLINE = (f'StartSel={START}, StopSel={STOP}, '
+                 f'MaxFragments=2, MinWords=10, MaxWords=30')
+
+
+def update_search_index(recipe_ids=None, using=DEFAULT_DB_ALIAS):
+    """Refresh the index of the given recipes (all recipes by default).
+    IDs of deleted recipes drop their SQLite index rows."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        statements = [
+            ("UPDATE recipes_recipe SET search_vector = "
+             "setweight(to_tsvector('russian', name), 'A') || "
+             "setweight(to_tsvector('russian', text), 'B')", 'id')]
+    elif connection.vendor == 'sqlite':
+        statements = [
+            (f'DELETE FROM {FTS_TABLE}', 'rowid'),
+            (f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+             f'SELECT id, name, text FROM recipes_recipe', 'id')]
+    else:
+        return
+    if recipe_ids is None:
+        batches = [None]
+    else:
+        recipe_ids = list(recipe_ids)
+        batches = [recipe_ids[start:start + BATCH_SIZE]
+                   for start in range(0, len(recipe_ids), BATCH_SIZE)]
+    with connection.cursor() as cursor:
+        for batch in batches:
+            for sql, column in statements:
+                if batch is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute('{} WHERE {} IN ({})'.format(
+                        sql, column, ', '.join(['%s'] * len(batch))), batch)
+
+
+def fts5_query(query):
+    """Match all words of `query` as prefixes, which also stands in for
+    stemming."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def _match(queryset, query):
+    """SQL and params of the condition selecting matching recipes."""
+    table = queryset.model._meta.db_table
+    if connections[queryset.db].vendor == 'postgresql':
+        return f'{table}.search_vector @@ {TSQUERY}', [query]
+    return (f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)', [fts5_query(query)])
+
+
+def filter_matches(queryset, query):
+    """Recipes of `queryset` matching `query`, unranked. Unlike `search`
+    the result can be combined with other querysets by `|`."""
+    if not re.search(r'\w', query):
+        return queryset.none()
+    if connections[queryset.db].vendor not in ('postgresql', 'sqlite'):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query))
+    return queryset.annotate(search_match=RawSQL(
+        *_match(queryset, query), output_field=BooleanField())).filter(
+            search_match=True)
+
+
+def search(queryset, query):
+    """Recipes of `queryset` matching `query`, best first, annotated with
+    `search_rank` and headlines `search_name` and `search_text`."""
+    if not re.search(r'\w', query):
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        queryset = filter_matches(queryset, query).annotate(
+            search_rank=RawSQL(
+                f'ts_rank({table}.search_vector, {TSQUERY})', [query],
+                output_field=FloatField()),
+            search_name=RawSQL(
+                f"ts_headline('russian', {table}.name, {TSQUERY}, %s)",
+                [query, NAME_HEADLINE], output_field=TextField()),
+            search_text=RawSQL(
+                f"ts_headline('russian', {table}.text, {TSQUERY}, %s)",
+                [query, TEXT_HEADLINE], output_field=TextField()))
+    elif vendor == 'sqlite':
+        # FTS5 ranks and highlights only rows of the MATCH query itself,
+        # a correlated subquery would repeat the MATCH for every recipe.
+        # DISTINCT does not change the one-to-one join, but keeps
+        # `count()` from grouping, where these functions are rejected.
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s',
+                   f'{FTS_TABLE}.rowid = {table}.id'],
+            params=[fts5_query(query)],
+        ).annotate(
+            search_rank=RawSQL(
+                f'-bm25({FTS_TABLE}, 10.0, 1.0)', (),
+                output_field=FloatField()),
+            search_name=RawSQL(
+                f'highlight({FTS_TABLE}, 0, char(2), char(3))', (),
+                output_field=TextField()),
+            search_text=RawSQL(
+                f"snippet({FTS_TABLE}, 1, char(2), char(3), '…', 24)", (),
+                output_field=TextField())).distinct()
+    else:
+        return filter_matches(queryset, query).annotate(
+            search_rank=Value(0, FloatField()),
+            search_name=Value(None, TextField()),
+            search_text=Value(None, TextField()))
+    return queryset.order_by('-search_rank', '-created', '-id')
+
+
+def highlight(headline):
+    """HTML of a headline with matches wrapped in <mark>."""
+    if headline is None:
+        return None
+    return html.escape(headline).replace(START, '<mark>').replace(
+        STOP, '</mark>')
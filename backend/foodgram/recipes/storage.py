@@ -0,0 +1,28 @@
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+
+class DeduplicatingStorage(FileSystemStorage):
+    """File storage that keeps content-addressed files only once.
+
+    Files named `<sha256>.<ext>` are written only if no file with that
+    name exists yet. Other names get the usual unique suffixes.
+    """
+
+    @staticmethod
+    def is_hashed(name):
+        return bool(HASHED_NAME.match(os.path.basename(name)))
+
+    def get_available_name(self, name, max_length=None):
+        if self.is_hashed(name) and self.exists(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if self.is_hashed(name) and self.exists(name):
+            return name
+        return super()._save(name, content)
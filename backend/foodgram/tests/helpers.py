@@ -0,0 +1,37 @@
+from django.core.cache import caches
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name=username, last_name=username, password='Pa55-word!')
+
+
+def create_tags(count):
+    return [Tag.objects.create(name=f'Тег {number}', color=f'#00000{number}',
+                               slug=f'tag-{number}')
+            for number in range(count)]
+
+
+def create_ingredients(count):
+    return [Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(count)]
+
+
+def create_recipe(author, tags, ingredients, name='Рецепт'):
+    recipe = Recipe.objects.create(author=author, name=name, text='Текст',
+                                   cooking_time=10)
+    recipe.tags.set(tags)
+    IngredientRecipe.objects.bulk_create(
+        [IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+         for ingredient in ingredients])
+    return recipe
@@ -0,0 +1,40 @@
+from django.db.models import F
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from tests.helpers import clear_caches, create_user
+
+from users.models import User
+
+
+class CachedTokenTests(APITestCase):
+    """A cached token still loads the current user on every request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        clear_caches()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_user_changed(self):
+        User.objects.filter(pk=self.user.pk).update(first_name='Новое имя')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['first_name'], 'Новое имя')
+
+    def test_user_deactivated(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_counter_kept_by_password_change(self):
+        User.objects.filter(pk=self.user.pk).update(
+            followers_count=F('followers_count') + 1)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'Pa55-word!',
+            'new_password': 'N3w-Pa55-word!',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 1)
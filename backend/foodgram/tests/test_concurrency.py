@@ -0,0 +1,88 @@
+import threading
+
+from django.db import connection, connections
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+from tests.helpers import (clear_caches, create_ingredients, create_recipe,
+                           create_tags, create_user)
+
+from recipes.models import Favorite, ShoppingCart, ShoppingListItem
+
+THREADS = 8
+
+
+class ConcurrentToggleTests(TransactionTestCase):
+    """Concurrent requests adding or removing the same recipe create or
+    delete one row and keep counters and shopping lists exact."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite in memory locks tables of concurrent '
+                          'transactions, set DB_TEST_NAME.')
+        clear_caches()
+        self.user = create_user('viewer')
+        self.ingredient = create_ingredients(1)[0]
+        self.recipe = create_recipe(
+            create_user('author'), create_tags(1), [self.ingredient])
+
+    def run_threads(self, method, url, batch_url=None):
+        """Send THREADS requests at once, every second one to `batch_url`
+        if given, return response statuses."""
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+
+        def request(number):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                if batch_url is not None and number % 2:
+                    response = getattr(client, method)(
+                        batch_url, {'ids': [self.recipe.id]}, format='json')
+                    results = response.data
+                    statuses.append(
+                        400 if results[0]['status'] == 'error'
+                        else {'post': 201, 'delete': 204}[method])
+                else:
+                    statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=request, args=(number,))
+                   for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def assert_toggles(self, url, model, counter, batch_url=None):
+        for method, created, expected in (('post', 201, 1),
+                                          ('delete', 204, 0)):
+            with self.subTest(method=method):
+                statuses = self.run_threads(method, url, batch_url)
+                self.assertEqual(len(statuses), THREADS)
+                self.assertLessEqual(set(statuses), {created, 400})
+                rows = model.objects.filter(
+                    user=self.user, recipe=self.recipe).count()
+                self.assertEqual(rows, expected)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), rows)
+                self.assertEqual(statuses.count(created), 1)
+
+    def test_favorite(self):
+        self.assert_toggles(f'/api/recipes/{self.recipe.id}/favorite/',
+                            Favorite, 'favorites_count')
+
+    def test_shopping_cart(self):
+        self.assert_toggles(f'/api/recipes/{self.recipe.id}/shopping_cart/',
+                            ShoppingCart, 'carts_count')
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_shopping_cart_batch(self):
+        # Batch requests check rows before changing them, which is safe
+        # only while the recipe row is locked.
+        self.assert_toggles(f'/api/recipes/{self.recipe.id}/shopping_cart/',
+                            ShoppingCart, 'carts_count',
+                            '/api/recipes/shopping_cart/')
+        self.assertFalse(ShoppingListItem.objects.exists())
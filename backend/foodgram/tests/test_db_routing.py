@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from foodgram.db import PIN_COOKIE, DatabaseRoutingMiddleware
+from tests.helpers import create_user
+
+from users.models import User
+
+
+class PinCookieTests(TestCase):
+    """Only requests that change data pin the client to the primary."""
+
+    def setUp(self):
+        patcher = mock.patch.dict(
+            settings.DATABASES, replica=settings.DATABASES['default'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_view(self, view):
+        def get_response(request):
+            view()
+            return HttpResponse()
+
+        middleware = DatabaseRoutingMiddleware(get_response)
+        return middleware(RequestFactory().post('/api/users/'))
+
+    def test_read(self):
+        response = self.run_view(lambda: list(
+            User.objects.select_for_update().all()))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write(self):
+        response = self.run_view(lambda: create_user('user'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(DB_CONN_HEALTH_CHECKS=True, DB_CONN_HEALTH_CHECK_IDLE=60)
+class HealthCheckTests(TestCase):
+    """Connections are checked only after being idle."""
+
+    def test_busy_connection(self):
+        middleware = DatabaseRoutingMiddleware(
+            lambda request: HttpResponse(User.objects.count()))
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=True) as is_usable:
+            middleware(RequestFactory().get('/api/users/'))
+            self.assertEqual(is_usable.call_count, 1)
+            middleware(RequestFactory().get('/api/users/'))
+            self.assertEqual(is_usable.call_count, 1)
@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from tests.helpers import create_recipe, create_tags, create_user
+
+from recipes import images
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class VariantUrlTests(TestCase):
+    """Variant URLs are given once the recipe is flagged, without storage
+    lookups."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_ready_after_generation(self):
+        recipe = create_recipe(create_user('author'), create_tags(1), [])
+        content = BytesIO()
+        Image.new('RGB', (20, 20)).save(content, 'PNG')
+        recipe.image.save('picture.png', ContentFile(content.getvalue()))
+        urls = images.get_variant_urls(recipe.image,
+                                       recipe.image_variants_ready)
+        self.assertEqual(set(urls.values()), {recipe.image.url})
+        images.generate_variants(recipe.image.storage, recipe.image.name)
+        images.mark_variants_ready(recipe.image.name)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        with mock.patch.object(type(recipe.image.storage), 'exists',
+                               side_effect=AssertionError):
+            urls = images.get_variant_urls(recipe.image, True)
+        for variant, url in urls.items():
+            self.assertTrue(url.endswith(f'_{variant}.webp'))
@@ -0,0 +1,57 @@
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from tests.helpers import (create_ingredients, create_recipe, create_tags,
+                           create_user)
+
+from recipes.loaders import load_rows
+from recipes.models import IngredientRecipe, ShoppingCart, Tag
+
+
+class LoadRowsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        cls.ingredient = create_ingredients(1)[0]
+        cls.recipe = create_recipe(create_user('author'), create_tags(1), [])
+
+    def test_foreign_key_columns(self):
+        rows = [{'recipe_id': self.recipe.id,
+                 'ingredient_id': self.ingredient.id, 'amount': 3}]
+        self.assertEqual(load_rows(IngredientRecipe, rows)[:2], (1, 1))
+        self.assertEqual(
+            self.recipe.recipe_ingredients.get().amount, 3)
+
+    def test_duplicates_skipped(self):
+        rows = [{'user': self.user.id, 'recipe': self.recipe.id}]
+        self.assertEqual(load_rows(ShoppingCart, rows)[:2], (1, 1))
+        self.assertEqual(load_rows(ShoppingCart, rows)[:2], (1, 0))
+
+    def test_missing_value(self):
+        rows = [{'recipe_id': self.recipe.id,
+                 'ingredient_id': self.ingredient.id}]
+        with self.assertRaises(ValueError):
+            load_rows(IngredientRecipe, rows)
+
+    def test_value_out_of_range(self):
+        self.recipe.delete()
+        rows = [{'author_id': self.user.id, 'name': 'Рецепт', 'text': '',
+                 'cooking_time': 1, 'favorites_count': -1}]
+        with self.assertRaises(ValueError):
+            load_rows(type(self.recipe), rows)
+
+    def test_fixture_objects(self):
+        rows = [{'model': 'recipes.tag', 'pk': 50,
+                 'fields': {'name': 'Завтрак', 'color': '#E26C2D',
+                            'slug': 'breakfast'}},
+                {'model': 'recipes.ingredient', 'pk': 1,
+                 'fields': {'name': 'Соль', 'measurement_unit': 'г'}}]
+        self.assertEqual(load_rows(Tag, rows)[:2], (1, 1))
+        self.assertEqual(Tag.objects.get(pk=50).slug, 'breakfast')
+
+
+class LoadDataCommandTests(TestCase):
+
+    def test_derived_data_models_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('load_data', 'recipes.Recipe', 'recipes.json')
@@ -0,0 +1,30 @@
+from django.test import override_settings
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APITestCase
+from tests.helpers import clear_caches, create_tags
+
+from api.metrics import _histograms
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class SerializeTimingTests(APITestCase):
+    """Serialization is timed in every view, not only in views of
+    serializers with viewer state."""
+
+    def setUp(self):
+        clear_caches()
+        create_tags(2)
+
+    def test_plain_serializer(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        route = response.resolver_match.view_name
+        self.assertTrue(any(
+            histogram.sum > 0 for labels, histogram
+            in _histograms['serialize_duration_seconds'].items()
+            if labels[1] == route))
+
+    def test_serializers_not_patched(self):
+        self.assertEqual(BaseSerializer.data.fget.__module__,
+                         'rest_framework.serializers')
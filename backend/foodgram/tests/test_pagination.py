@@ -0,0 +1,100 @@
+from rest_framework.test import APITestCase
+from tests.helpers import (clear_caches, create_ingredients, create_recipe,
+                           create_tags, create_user)
+
+
+class PersonalCountTests(APITestCase):
+    """Counts of the viewer's own lists are not served from the cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        author = create_user('author')
+        tags = create_tags(1)
+        ingredients = create_ingredients(1)
+        cls.recipes = [
+            create_recipe(author, tags, ingredients, name=f'Рецепт {number}')
+            for number in range(2)]
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_authenticate(self.user)
+
+    def get_count(self, url):
+        return self.client.get(url).data['count']
+
+    def test_cart_count(self):
+        url = '/api/recipes/?is_in_shopping_cart=1'
+        self.assertEqual(self.get_count(url), 0)
+        for number, recipe in enumerate(self.recipes, 1):
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+            self.assertEqual(self.get_count(url), number)
+
+    def test_subscription_count(self):
+        url = '/api/users/subscriptions/'
+        self.assertEqual(self.get_count(url), 0)
+        self.client.post(f'/api/users/{self.recipes[0].author_id}/subscribe/')
+        self.assertEqual(self.get_count(url), 1)
+
+
+class CachedCountTests(APITestCase):
+    """Pages follow the rows, not the cached count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = create_tags(1)
+        cls.ingredients = create_ingredients(1)
+        for number in range(2):
+            create_recipe(cls.author, cls.tags, cls.ingredients,
+                          name=f'Рецепт {number}')
+
+    def setUp(self):
+        clear_caches()
+
+    def test_page_after_create(self):
+        response = self.client.get('/api/recipes/?limit=1&page=2')
+        self.assertEqual(response.data['count'], 2)
+        self.assertIsNone(response.data['next'])
+        create_recipe(self.author, self.tags, self.ingredients,
+                      name='Новый рецепт')
+        response = self.client.get('/api/recipes/?limit=1&page=2')
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=1&page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=1&page=4')
+        self.assertEqual(response.status_code, 404)
+
+
+class CursorTests(APITestCase):
+    """Keyset pages follow the newest-first order only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        tags = create_tags(1)
+        ingredients = create_ingredients(1)
+        cls.recipes = [
+            create_recipe(author, tags, ingredients, name=f'Рецепт {number}')
+            for number in range(3)]
+
+    def setUp(self):
+        clear_caches()
+
+    def test_pages(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=2')
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids, [recipe.id for recipe in self.recipes[::-1]])
+        self.assertIsNone(response.data['next'])
+
+    def test_other_ordering(self):
+        for query in ('search=рецепт', 'ordering=popular'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?cursor=&{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(query.split('=')[0], response.data)
@@ -0,0 +1,54 @@
+from rest_framework.test import APITestCase
+from tests.helpers import (clear_caches, create_ingredients, create_recipe,
+                           create_tags, create_user)
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+
+class RecipeQueryCountTests(APITestCase):
+    """The number of queries of recipe list and retrieve does not depend
+    on the page size or on the number of tags and ingredients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        tags = create_tags(3)
+        ingredients = create_ingredients(5)
+        cls.recipes = []
+        for number in range(8):
+            author = create_user(f'author-{number}')
+            recipe = create_recipe(author, tags, ingredients)
+            cls.recipes.append(recipe)
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            Subscription.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        clear_caches()
+
+    def assert_list_queries(self, count):
+        for limit in (2, 6):
+            clear_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(count):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(5)
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(5)
+
+    def test_retrieve_anonymous(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(len(response.data['ingredients']), 5)
+
+    def test_retrieve_authenticated(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['author']['is_subscribed'])
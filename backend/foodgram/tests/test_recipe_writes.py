@@ -0,0 +1,127 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APITestCase
+from tests.helpers import (clear_caches, create_ingredients, create_recipe,
+                           create_tags, create_user)
+
+from api.serializers import RecipeCreateSerializer
+from recipes.counters import recount_recipes
+from recipes.models import Recipe, ShoppingCart
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data():
+    content = BytesIO()
+    Image.new('RGB', (2, 2)).save(content, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(content.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteQueryCountTests(APITestCase):
+    """The number of queries of recipe create and full update does not
+    depend on the number of ingredients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = create_tags(2)
+        cls.ingredients = create_ingredients(31)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_authenticate(self.author)
+
+    def payload(self, ingredients, name):
+        return {'name': name, 'text': 'Текст', 'cooking_time': 10,
+                'image': image_data(),
+                'tags': [tag.id for tag in self.tags],
+                'ingredients': [{'id': ingredient.id, 'amount': 5}
+                                for ingredient in ingredients]}
+
+    def count_queries(self, method, url, data):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code,
+                         201 if method == 'post' else 200, response.data)
+        return len(context.captured_queries)
+
+    def test_create(self):
+        counts = [self.count_queries(
+            'post', '/api/recipes/',
+            self.payload(self.ingredients[:size], f'Рецепт {size}'))
+            for size in (3, 30)]
+        self.assertEqual(counts[0], counts[1])
+
+    def test_full_update(self):
+        counts = []
+        for size in (3, 30):
+            recipe = create_recipe(self.author, self.tags[:1],
+                                   self.ingredients[:size], f'Рецепт {size}')
+            ShoppingCart.objects.create(user=self.author, recipe=recipe)
+            # One ingredient removed, one added and the rest changed.
+            counts.append(self.count_queries(
+                'put', f'/api/recipes/{recipe.id}/',
+                self.payload(self.ingredients[1:size + 1], recipe.name)))
+        self.assertEqual(counts[0], counts[1])
+
+
+class RecipeUpdateCounterTests(APITestCase):
+    """Saving a recipe or a user keeps counters changed after it was
+    loaded."""
+
+    def test_counter_changed_concurrently(self):
+        recipe = create_recipe(create_user('author'), create_tags(1),
+                               create_ingredients(1))
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') + 1,
+            carts_count=F('carts_count') + 1)
+        serializer = RecipeCreateSerializer(
+            recipe, data={'name': 'Новое название'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual((recipe.favorites_count, recipe.carts_count),
+                         (1, 1))
+
+    def test_full_save(self):
+        author = create_user('author')
+        recipe = create_recipe(author, create_tags(1), create_ingredients(1))
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') + 1)
+        User.objects.filter(pk=author.pk).update(
+            followers_count=F('followers_count') + 1)
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.is_active = False
+        author.save()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual((recipe.name, recipe.favorites_count),
+                         ('Новое название', 1))
+        self.assertEqual((author.is_active, author.followers_count),
+                         (False, 1))
+
+    def test_recount(self):
+        recipe = create_recipe(create_user('author'), create_tags(1),
+                               create_ingredients(1))
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        self.assertEqual(recount_recipes(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
@@ -0,0 +1,28 @@
+from rest_framework.test import APITestCase
+from tests.helpers import clear_caches, create_ingredients
+
+from api.reference_cache import get_stats
+
+
+class ReferenceCacheTests(APITestCase):
+    """Only unfiltered tag and ingredient responses are cached."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_ingredients(3)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_list_cached(self):
+        response = self.client.get('/api/ingredients/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/ingredients/').content,
+                             response.content)
+
+    def test_name_prefix_not_cached(self):
+        misses = get_stats().get('misses', 0)
+        for prefix in ('И', 'Ин', 'Инг'):
+            response = self.client.get(f'/api/ingredients/?name={prefix}')
+            self.assertEqual(len(response.data), 3)
+        self.assertEqual(get_stats().get('misses', 0), misses)
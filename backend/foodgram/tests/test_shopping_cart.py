@@ -0,0 +1,123 @@
+from rest_framework.test import APITestCase
+from tests.helpers import (clear_caches, create_ingredients, create_recipe,
+                           create_tags, create_user)
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class CartETagTests(APITestCase):
+    """The shopping list ETag changes with any change of its rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        cls.ingredients = create_ingredients(3)
+        for ingredient in cls.ingredients:
+            ShoppingListItem.objects.create(
+                user=cls.user, ingredient=ingredient, total_amount=2)
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_authenticate(self.user)
+
+    def get_etag(self):
+        return self.client.get(URL)['ETag']
+
+    def test_same_totals(self):
+        etag = self.get_etag()
+        # Row count, total amount and amounts weighted by ingredient IDs
+        # are all kept.
+        for ingredient, amount in zip(self.ingredients, (3, 0, 3)):
+            ShoppingListItem.objects.filter(
+                user=self.user, ingredient=ingredient).update(
+                    total_amount=amount)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_ingredient_renamed(self):
+        etag = self.get_etag()
+        self.assertEqual(self.get_etag(), etag)
+        ingredient = self.ingredients[0]
+        ingredient.name = 'Новое название'
+        ingredient.save()
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class RecipeUpdateShoppingListTests(APITestCase):
+    """Editing ingredients of a recipe changes the shopping lists of users
+    who have it in the cart by the difference of amounts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        tags = create_tags(1)
+        cls.ingredients = create_ingredients(4)
+        cls.recipe = create_recipe(cls.author, tags, cls.ingredients[:3])
+        other = create_recipe(cls.author, tags, cls.ingredients[:1],
+                              name='Другой рецепт')
+        cls.users = [create_user(f'viewer-{number}') for number in range(3)]
+        for user in cls.users[:2]:
+            ShoppingCart.objects.create(user=user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.users[0], recipe=other)
+        ShoppingCart.objects.create(user=cls.users[2], recipe=other)
+        ShoppingListItem.objects.rebuild()
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_authenticate(self.author)
+
+    def test_ingredients_changed(self):
+        first, second, third, fourth = self.ingredients
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'ingredients': [{'id': first.id, 'amount': 5},
+                             {'id': third.id, 'amount': 10},
+                             {'id': fourth.id, 'amount': 7}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        items = ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount')
+        self.assertCountEqual(items, ShoppingListItem.objects.expected())
+        self.assertCountEqual(items, [
+            (self.users[0].id, first.id, 15),
+            (self.users[0].id, third.id, 10),
+            (self.users[0].id, fourth.id, 7),
+            (self.users[1].id, first.id, 5),
+            (self.users[1].id, third.id, 10),
+            (self.users[1].id, fourth.id, 7),
+            (self.users[2].id, first.id, 10)])
+
+
+class DriftedCounterTests(APITestCase):
+    """Removing recipes never takes counters below zero."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('viewer')
+        cls.recipe = create_recipe(create_user('author'), create_tags(1),
+                                   create_ingredients(1))
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_authenticate(self.user)
+        # The row exists, but the counter missed it.
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+
+    def assert_removed(self):
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.carts_count, 0)
+
+    def test_batch_delete(self):
+        response = self.client.delete('/api/recipes/shopping_cart/',
+                                      {'ids': [self.recipe.id]},
+                                      format='json')
+        self.assertEqual(response.data[0]['status'], 'deleted')
+        self.assert_removed()
+
+    def test_single_delete(self):
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_removed()
@@ -0,0 +1,31 @@
+from django.test import TestCase
+from tests.helpers import create_recipe, create_tags, create_user
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class AuthorChangeTests(TestCase):
+    """Recipes are touched only when author fields they show change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author, create_tags(1), [])
+
+    def get_updated(self):
+        return Recipe.objects.get(pk=self.recipe.pk).updated
+
+    def test_password_change(self):
+        updated = self.get_updated()
+        author = User.objects.get(pk=self.author.pk)
+        author.set_password('N3w-pa55word')
+        author.save()
+        self.assertEqual(self.get_updated(), updated)
+
+    def test_name_change(self):
+        updated = self.get_updated()
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        self.assertGreater(self.get_updated(), updated)
@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 
+from recipes.counters import CounterSyncMixin
+from recipes.models import FeedEntry
 from users.models import Subscription, User
 
 
@@ -11,13 +14,16 @@ class UserAdmin(admin.ModelAdmin):
                     'last_name',
                     'is_active',
                     'last_login',
+                    'recipes_count',
+                    'followers_count',
                     )
     list_editable = ('is_active',)
+    readonly_fields = User.counter_fields
     search_fields = ('username', 'email')
     empty_value_display = '-пусто-'
 
 
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(CounterSyncMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'user',
                     'author',
@@ -25,6 +31,23 @@ class SubscriptionAdmin(admin.ModelAdmin):
     list_editable = ('user', 'author',)
     list_filter = ('user', 'author')
 
+    def get_counter_objects(self, obj):
+        return [], [obj.author_id]
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        user_ids = {obj.user_id}
+        if change:
+            user_ids.add(type(obj).objects.get(pk=obj.pk).user_id)
+        super().save_model(request, obj, form, change)
+        FeedEntry.objects.rebuild(user_ids)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        FeedEntry.objects.rebuild(user_ids)
+
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
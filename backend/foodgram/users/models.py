@@ -2,7 +2,26 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Model with `counter_fields` changed only by `F()` updates.
+
+    Full saves of existing rows leave them out, so that values read
+    before concurrent updates are not written back over them.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Custom user model."""
     email = models.EmailField(
         'email',
@@ -20,6 +39,28 @@ class User(AbstractUser):
         max_length=150,
     )
 
+    recipes_count = models.PositiveIntegerField(
+        'количество рецептов',
+        default=0,
+        editable=False,
+    )
+
+    followers_count = models.PositiveIntegerField(
+        'количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    # Off for authors with too many followers or recipes: their recipes
+    # are not copied into timelines, the feed reads them directly.
+    feed_fanout = models.BooleanField(
+        'рецепты рассылаются в ленты',
+        default=True,
+        editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'followers_count', 'feed_fanout')
+
     class Meta:
         ordering = ['id']
         verbose_name = 'пользователь'